@@ -15,15 +15,24 @@ Author: Syed Mohsin
 Date: August 2025
 """
 
+import asyncio
 import os
+import tempfile
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+import json
 import logging
+try:
+    import orjson
+except ImportError:  # orjson ships with requirements.txt but not the root pyproject
+    orjson = None
 from functools import lru_cache
 from contextlib import asynccontextmanager
 
@@ -36,6 +45,7 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up Long-Term Financial Simulation API")
+    ensure_parquet_copies()
     load_data()
     logger.info("Data loaded successfully")
     yield
@@ -61,6 +71,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse if orjson is not None else JSONResponse,
     lifespan=lifespan
 )
 
@@ -80,6 +91,10 @@ LIBRARY_FILE = DATA_DIR / "final_path_statistics_library.csv"
 PARAM_FILE = DATA_DIR / "param_library.csv"
 SHORT_TERM_BASELINE_FILE = DATA_DIR / "normal_vs_fragile_table.csv"
 
+# Cap concurrent demo_summary simulations so bursts queue instead of exhausting CPU/memory
+DEMO_SUMMARY_CONCURRENCY = int(os.environ.get("DEMO_SUMMARY_CONCURRENCY", max(2, os.cpu_count() or 1)))
+_demo_summary_slots = asyncio.Semaphore(DEMO_SUMMARY_CONCURRENCY)
+
 # Global data storage
 library_df: Optional[pd.DataFrame] = None
 param_df: Optional[pd.DataFrame] = None
@@ -158,6 +173,15 @@ class ErrorResponse(BaseModel):
     error: str = Field(..., description="Error message")
     detail: str = Field(..., description="Detailed error information")
 
+class ScenarioRequest(BaseModel):
+    """A single mean/spread scenario selector"""
+    mean: float = Field(..., ge=0.0, le=0.20, description="Target mean annual return (e.g., 0.06 for 6%)")
+    spread: float = Field(..., ge=0.5, le=5.0, description="Target spread/risk level")
+
+class ScenarioBatchRequest(BaseModel):
+    """Several scenarios to analyze in one call"""
+    scenarios: List[ScenarioRequest] = Field(..., min_length=1, max_length=20, description="Scenarios to analyze (1..20)")
+
 # =============================================================================
 # Short-Term: Pydantic Models
 # =============================================================================
@@ -191,9 +215,63 @@ class ShortTermBaselineRow(BaseModel):
 # Data Loading and Caching
 # =============================================================================
 
-@lru_cache(maxsize=1)
+def _json_bytes(obj: Any) -> bytes:
+    """Compact JSON bytes for cached payloads, via orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def _file_mtime(path: Path) -> float:
+    """Modification time used to key cached loads (0.0 when the file is missing)"""
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+def _parquet_sibling(csv_path: Path) -> Path:
+    return csv_path.with_suffix(".parquet")
+
+def ensure_parquet_copies() -> None:
+    """Write a Parquet sibling for each data CSV that is missing one or whose copy is stale"""
+    for csv_path in sorted(DATA_DIR.glob("*.csv")):
+        parquet_path = _parquet_sibling(csv_path)
+        if _file_mtime(parquet_path) >= _file_mtime(csv_path):
+            continue
+        tmp_path = None
+        try:
+            # Every worker runs this at startup: give each writer its own temp file so
+            # concurrent cold starts never replace or unlink another worker's copy
+            fd, tmp_path = tempfile.mkstemp(dir=DATA_DIR, suffix=".parquet.tmp")
+            os.close(fd)
+            # Default C parser on purpose: pyarrow's float parsing differs in the last ulp,
+            # and the copy must load exactly what the CSV fallback would
+            pd.read_csv(csv_path).to_parquet(tmp_path, compression="zstd", index=False)
+            os.replace(tmp_path, parquet_path)
+            logger.info(f"Wrote Parquet copy of {csv_path.name}")
+        except Exception as e:
+            # Read-only data volume or pyarrow not installed: keep serving from CSV
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+            logger.warning(f"Could not write Parquet copy of {csv_path.name}: {e}")
+
+def read_data_file(csv_path: Path) -> pd.DataFrame:
+    """Read a data table, preferring an up-to-date Parquet sibling over re-parsing the CSV"""
+    parquet_path = _parquet_sibling(csv_path)
+    if _file_mtime(parquet_path) >= _file_mtime(csv_path):
+        try:
+            # Memory-map rather than buffer the file: pages come straight from the OS cache
+            return pd.read_parquet(parquet_path, memory_map=True)
+        except Exception as e:
+            logger.warning(f"Falling back to CSV for {csv_path.name}: {e}")
+    return pd.read_csv(csv_path)
+
 def load_data() -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Load and cache the CSV data files"""
+    """Load the CSV data files, reusing the cached frames until either file changes on disk"""
+    return _load_data_cached(_file_mtime(LIBRARY_FILE), _file_mtime(PARAM_FILE))
+
+@lru_cache(maxsize=1)
+def _load_data_cached(library_mtime: float, param_mtime: float) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Load and cache the CSV data files (keyed on their mtimes)"""
     global library_df, param_df
     
     try:
@@ -201,14 +279,14 @@ def load_data() -> tuple[pd.DataFrame, pd.DataFrame]:
         if not LIBRARY_FILE.exists():
             raise FileNotFoundError(f"Library file not found: {LIBRARY_FILE}")
         
-        library_df = pd.read_csv(LIBRARY_FILE)
+        library_df = read_data_file(LIBRARY_FILE)
         logger.info(f"Loaded library with {len(library_df)} paths")
         
         # Load parameter library
         if not PARAM_FILE.exists():
             raise FileNotFoundError(f"Parameter file not found: {PARAM_FILE}")
         
-        param_df = pd.read_csv(PARAM_FILE)
+        param_df = read_data_file(PARAM_FILE)
         logger.info(f"Loaded parameters for {len(param_df)} scenarios")
         
         # Round numeric columns to desired precision
@@ -221,14 +299,18 @@ def load_data() -> tuple[pd.DataFrame, pd.DataFrame]:
         logger.error(f"Error loading data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to load data: {str(e)}")
 
-@lru_cache(maxsize=1)
 def load_short_term_baseline() -> pd.DataFrame:
-    """Load and cache the short-term baseline comparison CSV."""
+    """Load the short-term baseline comparison CSV, reloading only when it changes on disk."""
+    return _load_short_term_baseline_cached(_file_mtime(SHORT_TERM_BASELINE_FILE))
+
+@lru_cache(maxsize=1)
+def _load_short_term_baseline_cached(baseline_mtime: float) -> pd.DataFrame:
+    """Load and cache the short-term baseline comparison CSV (keyed on its mtime)."""
     global short_term_baseline_df
     try:
         if not SHORT_TERM_BASELINE_FILE.exists():
             raise FileNotFoundError(f"Short-term baseline file not found: {SHORT_TERM_BASELINE_FILE}")
-        short_term_baseline_df = pd.read_csv(SHORT_TERM_BASELINE_FILE)
+        short_term_baseline_df = read_data_file(SHORT_TERM_BASELINE_FILE)
         return short_term_baseline_df
     except Exception as e:
         logger.error(f"Error loading short-term baseline: {str(e)}")
@@ -305,17 +387,11 @@ def generate_envelope_data(df: pd.DataFrame) -> EnvelopeChartData:
     # Calculate percentiles of final values and work backwards
     annual_returns = df['actual_annual_return'].values
     
-    # Calculate compound growth for each percentile
-    p05_return = np.percentile(annual_returns, 5)
-    p50_return = np.percentile(annual_returns, 50)
-    p95_return = np.percentile(annual_returns, 95)
-    
-    # Generate paths assuming compound growth (starting from 1.0)
-    p05_path = [(1.0 * (1 + p05_return) ** year) for year in years]
-    p50_path = [(1.0 * (1 + p50_return) ** year) for year in years]
-    p95_path = [(1.0 * (1 + p95_return) ** year) for year in years]
+    # One partition pass for all three percentiles, then grow every path at once
+    growth = 1.0 + np.percentile(annual_returns, [5, 50, 95])
+    p05_path, p50_path, p95_path = np.power(growth[:, None], np.asarray(years)).tolist()
     
-    return EnvelopeChartData(
+    return EnvelopeChartData.model_construct(
         years=years,
         p05_path=p05_path,
         p50_path=p50_path,
@@ -327,7 +403,93 @@ def get_available_scenarios() -> List[tuple]:
     library_df, param_df = load_data()
     
     scenarios = library_df[['target_mean', 'target_spread']].drop_duplicates()
-    return [(row['target_mean'], row['target_spread']) for _, row in scenarios.iterrows()]
+    return list(zip(scenarios['target_mean'].tolist(), scenarios['target_spread'].tolist()))
+
+@lru_cache(maxsize=1)
+def _scenario_row_index(library_mtime: float, param_mtime: float) -> Dict[tuple, np.ndarray]:
+    """Map each (target_mean, target_spread) pair to its row positions in the library"""
+    library_df, param_df = load_data()
+    return library_df.groupby(['target_mean', 'target_spread'], sort=False).indices
+
+def build_scenario_data(mean: float, spread: float) -> ScenarioDataResponse:
+    """Build the full scenario response for one mean/spread pair (raises 404 if absent).
+
+    Responses are cached per scenario until the data files change on disk.
+    """
+    return _build_scenario_data_cached(mean, spread, _file_mtime(LIBRARY_FILE), _file_mtime(PARAM_FILE))
+
+@lru_cache(maxsize=256)
+def _build_scenario_data_cached(mean: float, spread: float,
+                                library_mtime: float, param_mtime: float) -> ScenarioDataResponse:
+    """Build one scenario response (keyed on the data file mtimes).
+
+    All values are derived from the cached library, so models are built with
+    model_construct() and skip per-field validation. 404s raise and are not cached.
+    """
+    library_df, param_df = load_data()
+    
+    # Look up the requested scenario's rows instead of masking the whole library
+    rows = _scenario_row_index(library_mtime, param_mtime).get((mean, spread))
+    
+    if rows is None:
+        available_scenarios = get_available_scenarios()
+        raise HTTPException(
+            status_code=404, 
+            detail=f"No data found for mean={mean}, spread={spread}. "
+                   f"Available scenarios: {available_scenarios}"
+        )
+    scenario_df = library_df.iloc[rows]
+    
+    # Create scenario info
+    scenario_info = ScenarioInfo.model_construct(
+        target_mean=mean,
+        target_spread=spread,
+        description=get_scenario_description(mean, spread),
+        semantic_category=categorize_spread(spread),
+        total_paths=len(scenario_df)
+    )
+    
+    # Calculate summary statistics
+    summary_stats = SummaryStatistics.model_construct(
+        average_annual_return=float(scenario_df['actual_annual_return'].mean()),
+        average_max_drawdown=float(scenario_df['max_drop'].mean()),
+        min_annual_return=float(scenario_df['actual_annual_return'].min()),
+        max_annual_return=float(scenario_df['actual_annual_return'].max()),
+        average_lost_decades=float(scenario_df['lost_decades'].mean()),
+        total_paths_in_scenario=len(scenario_df),
+        return_category=categorize_return(float(scenario_df['actual_annual_return'].mean())),
+        risk_category=categorize_spread(spread),
+        spread_range=get_spread_range_description(spread)
+    )
+    
+    # Generate envelope chart data
+    envelope_data = generate_envelope_data(scenario_df)
+    
+    # Create path details (limit to first 50 for performance)
+    details_df = scenario_df.head(50)
+    path_details = [
+        PathDetail.model_construct(
+            path_id=int(path_id),
+            actual_annual_return=annual_return,
+            max_drop=max_drop,
+            lost_decades=int(lost_decades),
+            return_category=categorize_return(annual_return),
+            drawdown_category=categorize_drawdown(max_drop)
+        )
+        for path_id, annual_return, max_drop, lost_decades in zip(
+            details_df['path_id'].tolist(),
+            details_df['actual_annual_return'].astype(float).tolist(),
+            details_df['max_drop'].astype(float).tolist(),
+            details_df['lost_decades'].tolist(),
+        )
+    ]
+    
+    return ScenarioDataResponse.model_construct(
+        scenario_info=scenario_info,
+        summary_statistics=summary_stats,
+        envelope_chart_data=envelope_data,
+        path_details_table=path_details
+    )
 
 # =============================================================================
 # API Endpoints
@@ -343,15 +505,40 @@ async def root():
         "endpoints": {
             "scenarios": "/long_term/scenarios",
             "paths": "/long_term/paths",
+            "paths_batch": "/long_term/paths/batch",
             "short_term_levels": "/short_term/levels",
             "short_term_baseline": "/short_term/baseline",
             "short_term_demo": "/short_term/demo_summary"
         }
     }
 
+@lru_cache(maxsize=1)
+def _scenario_listing_payload(library_mtime: float, param_mtime: float) -> bytes:
+    """Build and serialize the scenario listing once per version of the data files"""
+    library_df, param_df = load_data()
+    
+    # Get unique scenarios with their path counts in a single grouping pass
+    scenario_counts = library_df.groupby(['target_mean', 'target_spread'], sort=False).size()
+    
+    result = []
+    for (target_mean, target_spread), path_count in zip(scenario_counts.index.tolist(), scenario_counts.tolist()):
+        scenario_info = ScenarioInfo(
+            target_mean=target_mean,
+            target_spread=target_spread,
+            description=get_scenario_description(target_mean, target_spread),
+            semantic_category=categorize_spread(target_spread),
+            total_paths=path_count
+        )
+        result.append(scenario_info)
+    
+    # Sort by target_mean, then target_spread
+    result.sort(key=lambda x: (x.target_mean, x.target_spread))
+    return _json_bytes([scenario.model_dump() for scenario in result])
+
 @app.get(
     "/long_term/scenarios",
-    response_model=List[ScenarioInfo],
+    response_model=None,
+    responses={200: {"model": List[ScenarioInfo]}},
     tags=["Long-Term Analysis"],
     summary="List Available Scenarios",
     description="""
@@ -360,7 +547,7 @@ async def root():
     Each scenario represents a different risk/return profile with hundreds of simulation paths.
     """
 )
-async def get_scenarios(response: Response):
+async def get_scenarios():
     """
     Get all available scenarios with semantic categorization.
     
@@ -369,40 +556,17 @@ async def get_scenarios(response: Response):
     """
     try:
         logger.info("🤖 CHATGPT API CALL: get_scenarios() - Fetching all available investment scenarios")
-        library_df, param_df = load_data()
-        
-        # Get unique scenarios
-        scenarios = library_df[['target_mean', 'target_spread']].drop_duplicates()
-        
-        result = []
-        for _, row in scenarios.iterrows():
-            target_mean = row['target_mean']
-            target_spread = row['target_spread']
-            
-            # Count paths for this scenario
-            path_count = len(library_df[
-                (library_df['target_mean'] == target_mean) & 
-                (library_df['target_spread'] == target_spread)
-            ])
-            
-            scenario_info = ScenarioInfo(
-                target_mean=target_mean,
-                target_spread=target_spread,
-                description=get_scenario_description(target_mean, target_spread),
-                semantic_category=categorize_spread(target_spread),
-                total_paths=path_count
-            )
-            result.append(scenario_info)
-        
-        # Sort by target_mean, then target_spread
-        result.sort(key=lambda x: (x.target_mean, x.target_spread))
+        # The listing only changes with the data files, so serve the cached bytes
+        payload = _scenario_listing_payload(_file_mtime(LIBRARY_FILE), _file_mtime(PARAM_FILE))
         
         # Add custom header to prove this comes from YOUR API
-        response.headers["X-Data-Source"] = "Custom-FastAPI-Server-4671-Paths"
-        response.headers["X-API-Timestamp"] = str(pd.Timestamp.now())
+        headers = {
+            "X-Data-Source": "Custom-FastAPI-Server-4671-Paths",
+            "X-API-Timestamp": str(pd.Timestamp.now()),
+        }
         
-        logger.info(f"🤖 CHATGPT RESPONSE: Returning {len(result)} scenarios from YOUR FastAPI server with 4,671 paths")
-        return result
+        logger.info("🤖 CHATGPT RESPONSE: Returning scenarios from YOUR FastAPI server with 4,671 paths")
+        return Response(content=payload, media_type="application/json", headers=headers)
         
     except Exception as e:
         logger.error(f"Error in get_scenarios: {str(e)}")
@@ -410,7 +574,8 @@ async def get_scenarios(response: Response):
 
 @app.get(
     "/long_term/paths",
-    response_model=ScenarioDataResponse,
+    response_model=None,
+    responses={200: {"model": ScenarioDataResponse}},
     tags=["Long-Term Analysis"],
     summary="Get Detailed Scenario Data",
     description="""
@@ -448,68 +613,10 @@ async def get_scenario_data(
     """
     try:
         logger.info(f"🤖 CHATGPT API CALL: analyze_scenario(mean={mean}, spread={spread}) - Analyzing specific investment scenario")
-        library_df, param_df = load_data()
-        
-        # Filter data for the requested scenario
-        scenario_df = library_df[
-            (library_df['target_mean'] == mean) & 
-            (library_df['target_spread'] == spread)
-        ]
-        
-        if scenario_df.empty:
-            available_scenarios = get_available_scenarios()
-            raise HTTPException(
-                status_code=404, 
-                detail=f"No data found for mean={mean}, spread={spread}. "
-                       f"Available scenarios: {available_scenarios}"
-            )
-        
-        # Create scenario info
-        scenario_info = ScenarioInfo(
-            target_mean=mean,
-            target_spread=spread,
-            description=get_scenario_description(mean, spread),
-            semantic_category=categorize_spread(spread),
-            total_paths=len(scenario_df)
-        )
-        
-        # Calculate summary statistics
-        summary_stats = SummaryStatistics(
-            average_annual_return=float(scenario_df['actual_annual_return'].mean()),
-            average_max_drawdown=float(scenario_df['max_drop'].mean()),
-            min_annual_return=float(scenario_df['actual_annual_return'].min()),
-            max_annual_return=float(scenario_df['actual_annual_return'].max()),
-            average_lost_decades=float(scenario_df['lost_decades'].mean()),
-            total_paths_in_scenario=len(scenario_df),
-            return_category=categorize_return(scenario_df['actual_annual_return'].mean()),
-            risk_category=categorize_spread(spread),
-            spread_range=get_spread_range_description(spread)
-        )
-        
-        # Generate envelope chart data
-        envelope_data = generate_envelope_data(scenario_df)
+        # Cache misses do pandas work; keep it off the event loop
+        response = await run_in_threadpool(build_scenario_data, mean, spread)
         
-        # Create path details (limit to first 50 for performance)
-        path_details = []
-        for _, row in scenario_df.head(50).iterrows():
-            path_detail = PathDetail(
-                path_id=int(row['path_id']),
-                actual_annual_return=float(row['actual_annual_return']),
-                max_drop=float(row['max_drop']),
-                lost_decades=int(row['lost_decades']),
-                return_category=categorize_return(row['actual_annual_return']),
-                drawdown_category=categorize_drawdown(row['max_drop'])
-            )
-            path_details.append(path_detail)
-        
-        response = ScenarioDataResponse(
-            scenario_info=scenario_info,
-            summary_statistics=summary_stats,
-            envelope_chart_data=envelope_data,
-            path_details_table=path_details
-        )
-        
-        logger.info(f"Returned data for scenario: mean={mean}, spread={spread}, paths={len(scenario_df)}")
+        logger.info(f"Returned data for scenario: mean={mean}, spread={spread}, paths={response.scenario_info.total_paths}")
         return response
         
     except HTTPException:
@@ -518,6 +625,37 @@ async def get_scenario_data(
         logger.error(f"Error in get_scenario_data: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def _build_scenario_batch(scenarios: List[ScenarioRequest]) -> List[Union[ScenarioDataResponse, ErrorResponse]]:
+    """Build each scenario in request order, reporting failures in place (runs off the event loop)"""
+    results = []
+    for item in scenarios:
+        try:
+            results.append(build_scenario_data(item.mean, item.spread))
+        except HTTPException as e:
+            results.append(ErrorResponse(error=f"HTTP {e.status_code}", detail=str(e.detail)))
+        except Exception as e:
+            logger.error(f"Error in get_scenario_data_batch: {str(e)}")
+            results.append(ErrorResponse(error="Internal server error", detail=str(e)))
+    return results
+
+@app.post(
+    "/long_term/paths/batch",
+    response_model=None,
+    responses={200: {"model": List[Union[ScenarioDataResponse, ErrorResponse]]}},
+    tags=["Long-Term Analysis"],
+    summary="Get Detailed Data for Several Scenarios",
+    description="""
+    Batch variant of /long_term/paths for comparing scenarios in a single call.
+    Results are returned in request order; a scenario that cannot be served
+    yields an error item in its slot instead of failing the whole batch.
+    """
+)
+async def get_scenario_data_batch(request: ScenarioBatchRequest):
+    """Get comprehensive data for several scenarios with per-item error reporting."""
+    logger.info(f"🤖 CHATGPT API CALL: analyze_scenarios_batch(n={len(request.scenarios)}) - Analyzing several investment scenarios")
+    # One threadpool hop for the whole batch rather than one per scenario
+    return await run_in_threadpool(_build_scenario_batch, request.scenarios)
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Health check endpoint"""
@@ -539,9 +677,32 @@ async def health_check():
 # Short-Term Endpoints
 # =============================================================================
 
+@lru_cache(maxsize=1)
+def _short_term_levels_payload() -> bytes:
+    """Serialize the level metadata once; it only changes with the generator module"""
+    levels = []
+    for ps in default_param_sets():
+        levels.append(ShortTermLevelInfo(
+            param_set_id=ps.param_set_id,
+            category=ps.category,
+            level_rank=ps.level_rank,
+            drawdown=ps.drawdown,
+            t_down=ps.t_down,
+            t_up=ps.t_up,
+            envelope_asym=round(ps.t_up / max(1, ps.t_down), 6),
+            annual_vol=ps.annual_vol,
+            df_returns=ps.df_returns,
+            tanh_scale=ps.tanh_scale,
+            max_daily_return=ps.max_daily_return,
+            min_crisis_len=ps.min_crisis_len,
+        ))
+    levels.sort(key=lambda x: x.level_rank)
+    return _json_bytes([level.model_dump() for level in levels])
+
 @app.get(
     "/short_term/levels",
-    response_model=List[ShortTermLevelInfo],
+    response_model=None,
+    responses={200: {"model": List[ShortTermLevelInfo]}},
     tags=["Short-Term Analysis"],
     summary="List Short-Term Crisis Levels",
     description="Returns the default 7 short-term crisis parameter levels and metadata."
@@ -553,31 +714,15 @@ async def get_short_term_levels():
             detail="Short-term crisis generator module is not available. This endpoint requires the 'short_term_crisis_generator' module to be installed and properly configured."
         )
     try:
-        levels = []
-        for ps in default_param_sets():
-            levels.append(ShortTermLevelInfo(
-                param_set_id=ps.param_set_id,
-                category=ps.category,
-                level_rank=ps.level_rank,
-                drawdown=ps.drawdown,
-                t_down=ps.t_down,
-                t_up=ps.t_up,
-                envelope_asym=round(ps.t_up / max(1, ps.t_down), 6),
-                annual_vol=ps.annual_vol,
-                df_returns=ps.df_returns,
-                tanh_scale=ps.tanh_scale,
-                max_daily_return=ps.max_daily_return,
-                min_crisis_len=ps.min_crisis_len,
-            ))
-        levels.sort(key=lambda x: x.level_rank)
-        return levels
+        return Response(content=_short_term_levels_payload(), media_type="application/json")
     except Exception as e:
         logger.error(f"Error in get_short_term_levels: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get(
     "/short_term/baseline",
-    response_model=List[ShortTermBaselineRow],
+    response_model=None,
+    responses={200: {"model": List[ShortTermBaselineRow]}},
     tags=["Short-Term Analysis"],
     summary="Baseline: Normal vs Fragile Monthly Table",
     description="Serves the precomputed monthly comparison between 'normal' and 'fragile' regimes."
@@ -590,8 +735,63 @@ async def get_short_term_baseline():
     missing = [c for c in expected_cols if c not in df.columns]
     if missing:
         raise HTTPException(status_code=500, detail=f"Baseline CSV missing columns: {missing}")
-    return [ShortTermBaselineRow(**{k: (int(v) if k=='month' else float(v)) for k, v in row.items()})
-            for row in df[expected_cols].to_dict(orient='records')]
+    # Build rows straight from typed column lists rather than a records round-trip
+    months = df['month'].astype(int).tolist()
+    value_cols = [df[c].astype(float).tolist() for c in expected_cols[1:]]
+    rows = [dict(zip(expected_cols, (month, *values)))
+            for month, *values in zip(months, *value_cols)]
+    return Response(content=_json_bytes(rows), media_type="application/json")
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Equivalent of df.to_dict(orient='records'), built by zipping column lists"""
+    columns = df.columns.tolist()
+    return [dict(zip(columns, row)) for row in zip(*(df[c].tolist() for c in columns))]
+
+@lru_cache(maxsize=16)
+def _accepted_crisis_paths(ps, n_paths: int) -> pd.DataFrame:
+    """Long-form (path_id, t_day, price) frame of the first n_paths accepted crisis windows.
+
+    Seeds run from ps.seed_base, so the frame depends only on (ps, n_paths) and is cached; callers must not mutate it.
+    """
+    # Generate accepted crisis windows until n_paths
+    accepted = 0
+    seed = ps.seed_base
+    rows = []
+    while accepted < n_paths:
+        series = _generate_full_path(ps, seed)
+        crisis, ok = _crisis_window(series, ps)
+        seed += 1
+        if not ok:
+            continue
+        for t, price in enumerate(crisis.values.tolist()):
+            rows.append({"path_id": accepted, "t_day": t, "price": float(price)})
+        accepted += 1
+    return pd.DataFrame(rows)
+
+def _build_demo_summary(ps, n_paths: int, random_state: Optional[int]) -> Dict[str, Any]:
+    """Simulate accepted crisis paths for a param set and summarize them (CPU-bound, runs off the event loop)"""
+    series_df = _accepted_crisis_paths(ps, n_paths)
+    stats = compute_summaries(series_df, n_paths=min(n_paths, 100), random_state=random_state)
+    mn_table = monthly_table(stats)
+
+    return {
+        "param_set": {
+            "param_set_id": ps.param_set_id,
+            "category": ps.category,
+            "level_rank": ps.level_rank,
+            "drawdown": ps.drawdown,
+            "t_down": ps.t_down,
+            "t_up": ps.t_up,
+            "envelope_asym": round(ps.t_up / max(1, ps.t_down), 6),
+        },
+        "stats": _records(stats),
+        "monthly_table": _records(mn_table)
+    }
+
+@lru_cache(maxsize=64)
+def _seeded_demo_summary(ps, n_paths: int, random_state: int) -> Dict[str, Any]:
+    """A demo summary with an explicit random_state is deterministic, so the whole payload is cached"""
+    return _build_demo_summary(ps, n_paths, random_state)
 
 @app.get(
     "/short_term/demo_summary",
@@ -618,38 +818,9 @@ async def short_term_demo_summary(
             raise HTTPException(status_code=404, detail=f"Level {level} not found")
         ps = ps_map[level]
 
-        # Generate accepted crisis windows until n_paths
-        accepted = 0
-        seed = ps.seed_base
-        rows = []
-        while accepted < n_paths:
-            series = _generate_full_path(ps, seed)
-            crisis, ok = _crisis_window(series, ps)
-            seed += 1
-            if not ok:
-                continue
-            for t, price in enumerate(crisis.values.tolist()):
-                rows.append({"path_id": accepted, "t_day": t, "price": float(price)})
-            accepted += 1
-
-        # Build DataFrame and compute summaries
-        series_df = pd.DataFrame(rows)
-        stats = compute_summaries(series_df, n_paths=min(n_paths, 100), random_state=random_state)
-        mn_table = monthly_table(stats)
-
-        return {
-            "param_set": {
-                "param_set_id": ps.param_set_id,
-                "category": ps.category,
-                "level_rank": ps.level_rank,
-                "drawdown": ps.drawdown,
-                "t_down": ps.t_down,
-                "t_up": ps.t_up,
-                "envelope_asym": round(ps.t_up / max(1, ps.t_down), 6),
-            },
-            "stats": stats.to_dict(orient='records'),
-            "monthly_table": mn_table.to_dict(orient='records')
-        }
+        async with _demo_summary_slots:
+            build = _build_demo_summary if random_state is None else _seeded_demo_summary
+            return await run_in_threadpool(build, ps, n_paths, random_state)
 
     except HTTPException:
         raise
@@ -679,4 +850,17 @@ async def value_error_handler(request, exc):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8002, reload=True)
+    if os.environ.get("DEV") == "1":
+        uvicorn.run("main:app", host="0.0.0.0", port=8002, reload=True)
+    else:
+        # One worker per core; "auto" picks uvloop/httptools from uvicorn[standard]
+        # where available (uvloop has no Windows build, see start.bat)
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8002,
+            workers=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)),
+            loop="auto",
+            http="auto",
+            access_log=False,
+        )
@@ -0,0 +1,21 @@
+"""
+Shared pytest fixtures for the API test suite
+"""
+
+import pytest
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app, SHORT_TERM_BASELINE_FILE
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient (and one app startup) for the whole test session"""
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def baseline_df():
+    """The short-term baseline CSV, parsed once per session"""
+    return pd.read_csv(SHORT_TERM_BASELINE_FILE)
@@ -7,19 +7,13 @@ Run with: pytest test_api.py -v
 """
 
 import pytest
-import asyncio
-from fastapi.testclient import TestClient
-from main import app, load_data
+from main import load_data
 import pandas as pd
-import os
-
-# Create test client
-client = TestClient(app)
 
 class TestAPIEndpoints:
     """Test all API endpoints"""
     
-    def test_root_endpoint(self):
+    def test_root_endpoint(self, client):
         """Test root endpoint returns correct information"""
         response = client.get("/")
         assert response.status_code == 200
@@ -28,14 +22,14 @@ class TestAPIEndpoints:
         assert "version" in data
         assert "endpoints" in data
     
-    def test_health_endpoint(self):
+    def test_health_endpoint(self, client):
         """Test health check endpoint"""
         response = client.get("/health")
         assert response.status_code == 200
         data = response.json()
         assert "status" in data
     
-    def test_scenarios_endpoint(self):
+    def test_scenarios_endpoint(self, client):
         """Test scenarios endpoint returns valid data"""
         response = client.get("/long_term/scenarios")
         assert response.status_code == 200
@@ -57,7 +51,7 @@ class TestAPIEndpoints:
                 "conservative", "moderate", "aggressive"
             ]
     
-    def test_paths_endpoint_with_valid_params(self):
+    def test_paths_endpoint_with_valid_params(self, client):
         """Test paths endpoint with valid parameters"""
         # First get available scenarios
         scenarios_response = client.get("/long_term/scenarios")
@@ -100,7 +94,7 @@ class TestAPIEndpoints:
         assert "p95_path" in envelope
         assert len(envelope["years"]) == len(envelope["p05_path"])
     
-    def test_paths_endpoint_invalid_params(self):
+    def test_paths_endpoint_invalid_params(self, client):
         """Test paths endpoint with invalid parameters"""
         # Test with out-of-range values (should return 422 validation error)
         response = client.get("/long_term/paths?mean=999&spread=999")
@@ -111,7 +105,31 @@ class TestAPIEndpoints:
         # This might return 404 or 422 depending on available data
         assert response2.status_code in [404, 422]
     
-    def test_paths_endpoint_missing_params(self):
+    def test_paths_batch_endpoint(self, client):
+        """Test batch paths endpoint returns one item per scenario in order"""
+        scenarios = client.get("/long_term/scenarios").json()
+        if not scenarios:
+            pytest.skip("No scenarios available for testing")
+        
+        scenario = scenarios[0]
+        payload = {"scenarios": [
+            {"mean": scenario["target_mean"], "spread": scenario["target_spread"]},
+            {"mean": 0.15, "spread": 4.5},
+        ]}
+        response = client.post("/long_term/paths/batch", json=payload)
+        assert response.status_code == 200
+        
+        items = response.json()
+        assert len(items) == 2
+        assert items[0]["scenario_info"]["target_mean"] == scenario["target_mean"]
+        assert items[0]["scenario_info"]["target_spread"] == scenario["target_spread"]
+        # Unknown scenario is reported in place rather than failing the batch
+        assert "error" in items[1] and "detail" in items[1]
+        
+        # Empty batches are rejected by validation
+        assert client.post("/long_term/paths/batch", json={"scenarios": []}).status_code == 422
+    
+    def test_paths_endpoint_missing_params(self, client):
         """Test paths endpoint with missing parameters"""
         response = client.get("/long_term/paths")
         assert response.status_code == 422  # Validation error
@@ -157,6 +175,21 @@ class TestDataIntegrity:
         except Exception as e:
             pytest.fail(f"Data loading failed: {str(e)}")
 
+    def test_parquet_copies_match_csv(self):
+        """Test that Parquet copies load exactly what parsing the CSVs gives"""
+        from main import DATA_DIR, ensure_parquet_copies, read_data_file, _parquet_sibling
+        
+        ensure_parquet_copies()
+        for csv_path in sorted(DATA_DIR.glob("*.csv")):
+            if not _parquet_sibling(csv_path).exists():
+                pytest.skip("Parquet copies could not be written here")
+            pd.testing.assert_frame_equal(read_data_file(csv_path), pd.read_csv(csv_path), check_exact=True)
+        
+        # The rounded tables served by the API match rounding the CSVs directly
+        library_df, param_df = load_data()
+        pd.testing.assert_frame_equal(library_df, pd.read_csv(DATA_DIR / "final_path_statistics_library.csv").round(2), check_exact=True)
+        pd.testing.assert_frame_equal(param_df, pd.read_csv(DATA_DIR / "param_library.csv").round(2), check_exact=True)
+
 class TestSemanticCategorization:
     """Test semantic categorization functions"""
     
@@ -3,16 +3,10 @@ Tests for Short-Term endpoints in the FastAPI app
 """
 
 import pytest
-from fastapi.testclient import TestClient
-from main import app
-import pandas as pd
-
-
-client = TestClient(app)
 
 
 class TestShortTermEndpoints:
-    def test_levels_endpoint(self):
+    def test_levels_endpoint(self, client):
         resp = client.get("/short_term/levels")
         assert resp.status_code == 200
         data = resp.json()
@@ -30,10 +24,9 @@ class TestShortTermEndpoints:
         levels = [row["level_rank"] for row in data]
         assert levels == sorted(levels)
 
-    def test_baseline_endpoint(self):
-        # Read expected row count from CSV to validate the endpoint mirrors it
-        df = pd.read_csv("normal_vs_fragile_table.csv")
-        expected_rows = len(df)
+    def test_baseline_endpoint(self, client, baseline_df):
+        # Expected row count comes from the CSV to validate the endpoint mirrors it
+        expected_rows = len(baseline_df)
 
         resp = client.get("/short_term/baseline")
         assert resp.status_code == 200
@@ -47,7 +40,7 @@ class TestShortTermEndpoints:
         ]:
             assert key in r0
 
-    def test_demo_summary_endpoint(self):
+    def test_demo_summary_endpoint(self, client):
         # Keep this small for speed
         resp = client.get("/short_term/demo_summary?level=3&n_paths=12&random_state=42")
         assert resp.status_code == 200
@@ -19,18 +19,20 @@ Safe assumptions:
 
 Run:
   python generate_precomputed.py
+  COMPACT_PARQUET=1 python generate_precomputed.py   # also write Parquet copies
 """
 from __future__ import annotations
 import os
 import math
 import json
-import itertools
+import tempfile
 from pathlib import Path
 from typing import List, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 import networkx as nx
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 # ---------------- Configuration ----------------
 BASE_DIR = Path(__file__).parent
@@ -40,6 +42,8 @@ OUT_DIR = DATA_DIR / "precomputed"
 COMPACT_DIR = OUT_DIR / "compact"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 COMPACT_DIR.mkdir(parents=True, exist_ok=True)
+PARQUET_DIR = OUT_DIR / "parquet"
+WRITE_PARQUET = os.environ.get("COMPACT_PARQUET") == "1"
 
 # Raw file paths (do not rename originals; keep central reference)
 KB_FILE = DATA_DIR / "knowledge_base.csv"
@@ -52,24 +56,129 @@ T2_LOC_FILE = SC_DIR / "tier_2_locations_data.csv"
 
 # --------------- Helpers -----------------------
 
-def read_csv(path: Path) -> pd.DataFrame:
-    return pd.read_csv(path)
-
+def read_table(path: Path, columns: List[str] | None = None,
+               numeric_columns: List[str] | None = None) -> pd.DataFrame:
+    """Read a raw table, preferring an up-to-date Parquet sibling of the CSV.
+
+    The first run parses the CSV and writes the Parquet copy (whole table, so any
+    column subset can be served from it later); subsequent runs skip CSV parsing.
+    The copy is raw apart from ``numeric_columns``; the service keeps its own
+    cleaned ``*.clean.parquet`` of the products table, so the two never collide.
+    ``numeric_columns`` are coerced to float64 (bad values -> NaN) before the copy
+    is written, so later runs load them already typed.
+    """
+    parquet_path = path.with_suffix(".parquet")
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= path.stat().st_mtime:
+        try:
+            return pd.read_parquet(parquet_path, columns=columns)
+        except Exception as e:
+            print(f"[WARN] Falling back to CSV for {path.name}: {e}")
+    df = pd.read_csv(path)
+    for col in numeric_columns or ():
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    tmp_path = None
+    try:
+        # Unique temp file + rename: an interrupted run never leaves a partial copy
+        # that looks newer than the CSV
+        fd, tmp_path = tempfile.mkstemp(dir=parquet_path.parent, suffix=".parquet.tmp")
+        os.close(fd)
+        df.to_parquet(tmp_path, compression="snappy", index=False)
+        os.replace(tmp_path, parquet_path)
+    except Exception as e:
+        # pyarrow missing or read-only data dir: keep working from CSV
+        if tmp_path:
+            Path(tmp_path).unlink(missing_ok=True)
+        print(f"[WARN] Could not write Parquet copy of {path.name}: {e}")
+    return df[columns] if columns else df
+
+
+def add_input_edges(G: nx.DiGraph, inputs_df: pd.DataFrame) -> None:
+    """Add Input Product -> Main Product Name edges from a tier inputs table.
+
+    Columns are normalized and the cost coerced once per table instead of per row
+    (a no-op when read_table already typed it); rows with a blank product on
+    either side are dropped.
+    """
+    ip = inputs_df["Input Product"].fillna("").astype(str).str.strip().str.lower()
+    mp = inputs_df["Main Product Name"].fillna("").astype(str).str.strip().str.lower()
+    cost = pd.to_numeric(inputs_df["Percentage Cost"], errors="coerce").astype(float)
+    keep = (ip != "") & (mp != "")
+    G.add_edges_from(
+        (a, b, {"percentage_cost": c})
+        for a, b, c in zip(ip[keep].tolist(), mp[keep].tolist(), cost[keep].tolist())
+    )
 
-def normalize_str(s: str) -> str:
-    if pd.isna(s):
-        return ""
-    return str(s).strip().lower()
+def enumerate_sink_paths(indptr: List[int], indices: List[int], costs: List[float],
+                         root: int, max_depth: int) -> List[Tuple[List[int], List[float]]]:
+    """Iterative DFS over a CSR adjacency from ``root``.
+
+    Returns (node_ids, edge_costs) for every simple path of at most ``max_depth``
+    edges that ends at a sink node, in the order nx.all_simple_paths visits them
+    (successors are explored in adjacency order).
+    """
+    paths = []
+    path = [root]
+    path_costs = []
+    on_path = {root}
+    stack = [[indptr[root], indptr[root + 1]]]
+    while stack:
+        frame = stack[-1]
+        pos, end = frame
+        if pos == end:
+            stack.pop()
+            on_path.discard(path.pop())
+            if path_costs:
+                path_costs.pop()
+            continue
+        frame[0] = pos + 1
+        nxt = indices[pos]
+        if nxt in on_path:
+            continue
+        if indptr[nxt] == indptr[nxt + 1]:
+            paths.append((path + [nxt], path_costs + [costs[pos]]))
+        elif len(path) < max_depth:
+            path.append(nxt)
+            path_costs.append(costs[pos])
+            on_path.add(nxt)
+            stack.append([indptr[nxt], indptr[nxt + 1]])
+    return paths
+
+def top_n_per_group(df: pd.DataFrame, key: str, order_by: List[str],
+                    ascending: List[bool], n: int) -> pd.DataFrame:
+    """Keep the first ``n`` rows of each ``key`` group after ordering by ``order_by``.
+
+    Same rows and order as looping over groupby(key) with sort/nlargest/nsmallest
+    and concatenating, but done as one stable sort plus a groupby().head() on the
+    key's category codes.
+    """
+    ordered = df.sort_values([key, *order_by], ascending=[True, *ascending], kind="stable")
+    group_key = ordered[key].astype("category")
+    return ordered.groupby(group_key, observed=True, sort=False).head(n).reset_index(drop=True)
+
+def save_compact(df: pd.DataFrame, filename: str) -> None:
+    """Write a compact output CSV (the format uploaded to the Custom GPT).
+
+    With COMPACT_PARQUET=1 a snappy Parquet copy is also written to
+    precomputed/parquet/ for programmatic consumers (kept out of COMPACT_DIR so
+    the upload folder and its size estimate are unchanged).
+    """
+    out = COMPACT_DIR / filename
+    df.to_csv(out, index=False)
+    print(f"[COMPACT] Wrote {out} ({len(df)} rows)")
+    if WRITE_PARQUET:
+        PARQUET_DIR.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(PARQUET_DIR / Path(filename).with_suffix(".parquet"), compression="snappy", index=False)
 
 # --------------- Load raw data -----------------
 print("[INFO] Loading raw datasets ...")
-kb_df = read_csv(KB_FILE)
-event_df = read_csv(EVENT_TO_COMMODITY_FILE)
-company_products_df = read_csv(COMPANY_MAIN_PRODUCTS_FILE)
-t1_inputs_df = read_csv(T1_INPUTS_FILE)
-t2_inputs_df = read_csv(T2_INPUTS_FILE)
-t1_loc_df = read_csv(T1_LOC_FILE)
-t2_loc_df = read_csv(T2_LOC_FILE)
+INPUT_COLUMNS = ["Main Product Name", "Input Product", "Percentage Cost"]
+kb_df = read_table(KB_FILE)
+event_df = read_table(EVENT_TO_COMMODITY_FILE)
+company_products_df = read_table(COMPANY_MAIN_PRODUCTS_FILE, columns=["Ticker", "Product Name", "Industry", "share_pct"])
+t1_inputs_df = read_table(T1_INPUTS_FILE, columns=INPUT_COLUMNS, numeric_columns=["Percentage Cost"])
+t2_inputs_df = read_table(T2_INPUTS_FILE, columns=INPUT_COLUMNS, numeric_columns=["Percentage Cost"])
+t1_loc_df = read_table(T1_LOC_FILE, columns=["Company Name", "Product Name", "Location"])
+t2_loc_df = read_table(T2_LOC_FILE)
 
 # --------------- Build graph for paths ---------
 # Graph edges:
@@ -78,48 +187,32 @@ t2_loc_df = read_csv(T2_LOC_FILE)
 print("[INFO] Building supply chain graph ...")
 G = nx.DiGraph()
 
-# Add Tier 2 edges
-for _, r in t2_inputs_df.iterrows():
-    ip = normalize_str(r.get("Input Product"))
-    mp = normalize_str(r.get("Main Product Name") or r.get("Main Product") or r.get("Main Product Name"))
-    if not ip or not mp:
-        continue
-    cost = r.get("Percentage Cost")
-    try:
-        cost = float(cost)
-    except Exception:
-        cost = math.nan
-    G.add_edge(ip, mp, percentage_cost=cost)
-
-# Add Tier 1 edges
-for _, r in t1_inputs_df.iterrows():
-    ip = normalize_str(r.get("Input Product"))
-    mp = normalize_str(r.get("Main Product Name") or r.get("Main Product") or r.get("Main Product Name"))
-    if not ip or not mp:
-        continue
-    cost = r.get("Percentage Cost")
-    try:
-        cost = float(cost)
-    except Exception:
-        cost = math.nan
-    G.add_edge(ip, mp, percentage_cost=cost)
+# Add Tier 2 edges, then Tier 1 (later duplicates overwrite the edge cost, as before)
+add_input_edges(G, t2_inputs_df)
+add_input_edges(G, t1_inputs_df)
 
-# Attach companies to product nodes
+# Attach companies to product nodes: normalize/strip whole columns once, then
+# accumulate the sets from plain tuples instead of iterrows
+company_prods = company_products_df["Product Name"].fillna("").astype(str).str.strip().str.lower()
+company_tickers = company_products_df["Ticker"].astype(str).str.strip().where(company_products_df["Ticker"].notna())
+company_industries = company_products_df["Industry"].astype(str).str.strip().where(company_products_df["Industry"].notna())
 product_company_map = {}
-for _, r in company_products_df.iterrows():
-    prod = normalize_str(r.get("Product Name"))
-    ticker = r.get("Ticker")
-    industry = r.get("Industry")
+for prod, ticker, industry in zip(company_prods.tolist(), company_tickers.tolist(), company_industries.tolist()):
     if prod:
         d = product_company_map.setdefault(prod, {"tickers": set(), "industries": set()})
         if not pd.isna(ticker):
-            d["tickers"].add(str(ticker).strip())
+            d["tickers"].add(ticker)
         if not pd.isna(industry):
-            d["industries"].add(str(industry).strip())
+            d["industries"].add(industry)
 
 # --------------- supply_chain_paths.csv --------
 print("[INFO] Enumerating paths (depth<=3) ...")
-paths_records = []
+# One list per output column (no per-row dicts for DataFrame to re-key)
+paths_columns = {col: [] for col in (
+    "path_id", "root_product", "final_product", "depth", "node_sequence",
+    "companies", "industries", "edge_costs_percent", "cumulative_cost",
+)}
+path_node_ids = []  # flat node ids of every emitted path, for chain counts
 max_depth = 3
 path_id_counter = 1
 
@@ -128,62 +221,72 @@ MAX_TOTAL_PATHS = int(os.environ.get("MAX_TOTAL_PATHS", 50000))
 MAX_PATHS_PER_ROOT = int(os.environ.get("MAX_PATHS_PER_ROOT", 3000))
 truncated = False
 
-# Root candidates are any input products appearing as a source
-root_candidates = {u for u, v in G.out_degree() if G.out_degree(u) > 0}
+# Root candidates are any input products appearing as a source (sorted rather
+# than a set, so truncation and path ids don't depend on PYTHONHASHSEED)
+root_candidates = sorted(u for u, v in G.out_degree() if v > 0)
 leaf_nodes = [n for n, v in G.out_degree() if v == 0]
 
+# CSR adjacency over integer node ids (successors in G's adjacency order) so each
+# root needs a single DFS instead of has_path + all_simple_paths per leaf
+node_names = list(G.nodes)
+node_index = {n: i for i, n in enumerate(node_names)}
+indptr = np.zeros(len(node_names) + 1, dtype=np.int64)
+indptr[1:] = np.cumsum([len(G.adj[n]) for n in node_names])
+indices = np.fromiter((node_index[v] for n in node_names for v in G.adj[n]), dtype=np.int32, count=indptr[-1])
+costs = np.fromiter((d["percentage_cost"] for n in node_names for d in G.adj[n].values()), dtype=np.float64, count=indptr[-1])
+csr = (indptr.tolist(), indices.tolist(), costs.tolist())
+leaf_position = {node_index[leaf]: i for i, leaf in enumerate(leaf_nodes)}
+# Per-node ticker/industry tuples, looked up by id instead of via nested dict gets
+node_tickers = [tuple(product_company_map.get(n, {}).get("tickers", ())) for n in node_names]
+node_industries = [tuple(product_company_map.get(n, {}).get("industries", ())) for n in node_names]
+
 for root in root_candidates:
     if truncated:
         break
     per_root_count = 0
-    for leaf in leaf_nodes:
-        if truncated:
+    # Emit leaf by leaf (in leaf_nodes order) as the per-pair enumeration did
+    root_paths = enumerate_sink_paths(*csr, node_index[root], max_depth)
+    root_paths.sort(key=lambda item: leaf_position[item[0][-1]])
+    for node_ids, path_edge_costs in root_paths:
+        p = [node_names[i] for i in node_ids]
+        leaf = p[-1]
+        depth = len(p) - 1
+        # Collect edge costs
+        edge_costs = []
+        cumulative_cost = None
+        multiplicative_cost = 1.0
+        complete_cost = True
+        for c in path_edge_costs:
+            if math.isnan(c):
+                complete_cost = False
+            else:
+                edge_costs.append(c)
+                multiplicative_cost *= (c / 100.0)
+        if complete_cost and edge_costs:
+            cumulative_cost = multiplicative_cost * 100.0  # express as %
+        node_sequence = " > ".join(p)
+        companies = sorted(set().union(*[node_tickers[i] for i in node_ids]))
+        industries = sorted(set().union(*[node_industries[i] for i in node_ids]))
+        paths_columns["path_id"].append(f"P{path_id_counter}")
+        paths_columns["root_product"].append(root)
+        paths_columns["final_product"].append(leaf)
+        paths_columns["depth"].append(depth)
+        paths_columns["node_sequence"].append(node_sequence)
+        paths_columns["companies"].append(";".join(companies))
+        paths_columns["industries"].append(";".join(industries))
+        paths_columns["edge_costs_percent"].append("|".join(str(x) for x in edge_costs) if edge_costs else "")
+        paths_columns["cumulative_cost"].append(round(cumulative_cost, 4) if cumulative_cost is not None else "")
+        path_node_ids.extend(node_ids)
+        path_id_counter += 1
+        per_root_count += 1
+        if per_root_count >= MAX_PATHS_PER_ROOT or len(paths_columns["path_id"]) >= MAX_TOTAL_PATHS:
+            truncated = True
             break
-        if root == leaf:
-            continue
-        if not nx.has_path(G, root, leaf):
-            continue
-        for p in nx.all_simple_paths(G, root, leaf, cutoff=max_depth):
-            depth = len(p) - 1
-            # Collect edge costs
-            edge_costs = []
-            cumulative_cost = None
-            multiplicative_cost = 1.0
-            complete_cost = True
-            for a, b in zip(p[:-1], p[1:]):
-                data = G.get_edge_data(a, b) or {}
-                c = data.get("percentage_cost")
-                if c is None or (isinstance(c, float) and math.isnan(c)):
-                    complete_cost = False
-                else:
-                    edge_costs.append(c)
-                    multiplicative_cost *= (c / 100.0)
-            if complete_cost and edge_costs:
-                cumulative_cost = multiplicative_cost * 100.0  # express as %
-            node_sequence = " > ".join(p)
-            companies = sorted(set(itertools.chain.from_iterable(product_company_map.get(n, {}).get("tickers", []) for n in p)))
-            industries = sorted(set(itertools.chain.from_iterable(product_company_map.get(n, {}).get("industries", []) for n in p)))
-            paths_records.append({
-                "path_id": f"P{path_id_counter}",
-                "root_product": root,
-                "final_product": leaf,
-                "depth": depth,
-                "node_sequence": node_sequence,
-                "companies": ";".join(companies),
-                "industries": ";".join(industries),
-                "edge_costs_percent": "|".join(str(x) for x in edge_costs) if edge_costs else "",
-                "cumulative_cost": round(cumulative_cost, 4) if cumulative_cost is not None else ""
-            })
-            path_id_counter += 1
-            per_root_count += 1
-            if per_root_count >= MAX_PATHS_PER_ROOT or len(paths_records) >= MAX_TOTAL_PATHS:
-                truncated = True
-                break
-            # Progress heartbeat every 5000 paths
-            if path_id_counter % 5000 == 0:
-                print(f"[PROGRESS] Enumerated {path_id_counter} paths so far (current root={root})")
-
-paths_df = pd.DataFrame(paths_records)
+        # Progress heartbeat every 5000 paths
+        if path_id_counter % 5000 == 0:
+            print(f"[PROGRESS] Enumerated {path_id_counter} paths so far (current root={root})")
+
+paths_df = pd.DataFrame(paths_columns)
 if truncated:
     print(f"[WARN] Path enumeration truncated (total_paths={len(paths_df)}) due to limits: MAX_TOTAL_PATHS={MAX_TOTAL_PATHS} or MAX_PATHS_PER_ROOT={MAX_PATHS_PER_ROOT}")
 # Skip full version - generate compact only
@@ -191,7 +294,7 @@ print(f"[INFO] Generated {len(paths_df)} paths (skipping full save, proceeding t
 
 # --------------- product_aliases.csv -----------
 print("[INFO] Building product aliases from knowledge base terms + synonyms ...")
-aliases_records = []
+aliases_columns = {col: [] for col in ("canonical_term", "alias", "match_confidence", "type")}
 for _, r in kb_df.iterrows():
     canonical = str(r.get("Term", "")).strip()
     type_ = r.get("Type", "")
@@ -200,17 +303,16 @@ for _, r in kb_df.iterrows():
     if isinstance(syn_raw, str) and syn_raw.strip():
         # split by comma
         syn_list = [s.strip() for s in syn_raw.split(",") if s.strip()]
-    all_aliases = {canonical} | set(syn_list)
+    # canonical first, then synonyms in listed order (deduplicated, deterministic)
+    all_aliases = dict.fromkeys([canonical, *syn_list])
     for a in all_aliases:
         # simple heuristic confidence: canonical highest, synonyms medium
         conf = 0.95 if a == canonical else 0.75
-        aliases_records.append({
-            "canonical_term": canonical,
-            "alias": a,
-            "match_confidence": conf,
-            "type": type_
-        })
-product_aliases_df = pd.DataFrame(aliases_records)
+        aliases_columns["canonical_term"].append(canonical)
+        aliases_columns["alias"].append(a)
+        aliases_columns["match_confidence"].append(conf)
+        aliases_columns["type"].append(type_)
+product_aliases_df = pd.DataFrame(aliases_columns)
 # Skip full version
 print(f"[INFO] Generated {len(product_aliases_df)} aliases (skipping full save)")
 
@@ -225,31 +327,23 @@ industry_counts = (
     .size()
     .reset_index(name='company_product_pairs')
 )
-# chain_count approximated by number of paths where product appears
-if not paths_df.empty:
-    product_in_paths = paths_df['node_sequence'].str.split(' > ').explode()
-    chain_counts = (product_in_paths.value_counts()
-                    .reset_index()
-                    .set_axis(['product','chain_count'], axis=1))
-else:
-    chain_counts = pd.DataFrame(columns=['product', 'chain_count'])
-
-industry_exposure_rows = []
-for _, row in industry_counts.iterrows():
-    prod = row['Product Name_norm']
-    industry = row['Industry']
-    company_pairs = row['company_product_pairs']
-    cc_series = chain_counts.loc[chain_counts['product'] == prod, 'chain_count']
-    chain_count = int(cc_series.iloc[0]) if not cc_series.empty else 0
-    exposure_score = company_pairs + chain_count  # naive additive
-    industry_exposure_rows.append({
-        "product": prod,
-        "industry": industry,
-        "chain_count": chain_count,
-        "company_count": company_pairs,
-        "exposure_score": exposure_score
-    })
-industry_exposure_df = pd.DataFrame(industry_exposure_rows)
+# chain_count approximated by number of paths where product appears (a simple
+# path visits each node at most once, so a bincount over the emitted node ids)
+chain_counts = pd.DataFrame({
+    'product': node_names,
+    'chain_count': np.bincount(np.asarray(path_node_ids, dtype=np.int64), minlength=len(node_names)),
+})
+
+# One hash join instead of scanning chain_counts for every (product, industry) row
+industry_exposure_df = industry_counts.merge(
+    chain_counts.rename(columns={'product': 'Product Name_norm'}),
+    on='Product Name_norm', how='left',
+)
+industry_exposure_df['chain_count'] = industry_exposure_df['chain_count'].fillna(0).astype(int)
+industry_exposure_df['exposure_score'] = industry_exposure_df['company_product_pairs'] + industry_exposure_df['chain_count']  # naive additive
+industry_exposure_df = industry_exposure_df.rename(
+    columns={'Product Name_norm': 'product', 'Industry': 'industry', 'company_product_pairs': 'company_count'}
+)[['product', 'industry', 'chain_count', 'company_count', 'exposure_score']]
 # Skip full version
 print(f"[INFO] Generated {len(industry_exposure_df)} industry exposures (skipping full save)")
 
@@ -257,19 +351,14 @@ print(f"[INFO] Generated {len(industry_exposure_df)} industry exposures (skippin
 print("[INFO] Computing company product exposure ...")
 cp = company_products_df[['Ticker', 'Product Name', 'share_pct']].copy()
 cp['share_pct'] = pd.to_numeric(cp['share_pct'], errors='coerce')
-# bucket
-def bucket(x):
-    if pd.isna(x):
-        return "unknown"
-    if x >= 50:
-        return "High"
-    if x >= 20:
-        return "Medium"
-    if x > 0:
-        return "Low"
-    return "None"
-cp['exposure_bucket'] = cp['share_pct'].map(bucket)
-cp['exposure_index'] = cp['share_pct'].fillna(0) / 100.0
+# bucket (unknown / High >= 50 / Medium >= 20 / Low > 0 / None) in one vectorized pass
+share = cp['share_pct'].to_numpy(dtype=float)
+cp['exposure_bucket'] = np.select(
+    [np.isnan(share), share >= 50, share >= 20, share > 0],
+    ["unknown", "High", "Medium", "Low"],
+    default="None",
+).astype(object)
+cp['exposure_index'] = np.nan_to_num(share) / 100.0
 company_product_exposure_df = cp.rename(columns={'Product Name': 'product', 'Ticker': 'ticker'})[
     ['ticker', 'product', 'exposure_bucket', 'exposure_index']
 ]
@@ -318,21 +407,40 @@ print(f"[INFO] Generated {len(location_summary_df)} location summaries (skipping
 print("[INFO] Computing basic product similarity (token fuzz over product names) ...")
 products_list = sorted(set(company_products_df['Product Name'].dropna().astype(str)))
 # Limit comparisons for performance if extremely large
-max_pairs = 30000
-sim_rows = []
-for i, a in enumerate(products_list):
-    for b in products_list[i+1:]:
-        score = fuzz.token_set_ratio(a, b) / 100.0
-        if score < 0.5:
-            continue
-        sim_rows.append({"product_a": a, "product_b": b, "similarity_score": round(score, 4)})
-        if len(sim_rows) >= max_pairs:
-            break
-    if len(sim_rows) >= max_pairs:
+max_pairs = int(os.environ.get("MAX_SIMILARITY_PAIRS", 30000))
+# Score a block of rows at a time with rapidfuzz's multithreaded cdist (only
+# against products at or after the block), keeping pairs in the same row-major
+# (a, b) order as a pairwise loop so the max_pairs cut-off is unchanged.
+SIM_BLOCK_ROWS = 64
+sim_a, sim_b, sim_scores = [], [], []
+n_pairs = 0
+for start in range(0, len(products_list), SIM_BLOCK_ROWS):
+    if n_pairs >= max_pairs:
         break
-product_similarity_df = pd.DataFrame(sim_rows)
-# rank per product_a
-product_similarity_df['rank'] = product_similarity_df.groupby('product_a')['similarity_score'].rank(method='first', ascending=False)
+    scores = process.cdist(products_list[start:start + SIM_BLOCK_ROWS], products_list[start:],
+                           scorer=fuzz.token_set_ratio, score_cutoff=50,
+                           dtype=np.float64, workers=-1) / 100.0
+    rows, cols = np.nonzero(np.triu(scores >= 0.5, k=1))
+    rows, cols = rows[:max_pairs - n_pairs], cols[:max_pairs - n_pairs]
+    sim_a.append(start + rows)
+    sim_b.append(start + cols)
+    sim_scores.append(scores[rows, cols])
+    n_pairs += len(rows)
+products_arr = np.array(products_list, dtype=object)
+a_idx = np.concatenate(sim_a) if sim_a else np.empty(0, dtype=int)
+b_idx = np.concatenate(sim_b) if sim_b else np.empty(0, dtype=int)
+product_similarity_df = pd.DataFrame({
+    "product_a": products_arr[a_idx],
+    "product_b": products_arr[b_idx],
+    "similarity_score": np.round(np.concatenate(sim_scores) if sim_scores else np.empty(0), 4),
+})
+# rank per product_a: a stable lexsort on (product_a, -score) orders each product's
+# pairs best-first with ties in pair order, i.e. rank(method='first', ascending=False)
+sim_order = np.lexsort((-product_similarity_df['similarity_score'].to_numpy(), a_idx))
+sorted_a = a_idx[sim_order]
+sim_rank = np.empty(len(sim_order))
+sim_rank[sim_order] = np.arange(len(sim_order)) - np.searchsorted(sorted_a, sorted_a, side='left') + 1
+product_similarity_df['rank'] = sim_rank
 # Skip full version
 print(f"[INFO] Generated {len(product_similarity_df)} similarities (skipping full save)")
 
@@ -392,26 +500,30 @@ print("[INFO] Skipping indirect exposures computation and output as per new requ
 
 # --------------- scenario_overlap_summary.csv --
 print("[INFO] Computing scenario overlap summary (company occurrences per scenario) ...")
-overlap_rows = []
 # Use scenario_expansions linked products -> map to companies via company_products_df
-prod_to_companies = company_products_df.groupby('Product Name')['Ticker'].apply(lambda s: sorted(set(s.dropna().astype(str)))).to_dict()
-for _, r in scenario_expansions_df.iterrows():
-    scen = r['scenario']
-    linked_products = [p.strip() for p in str(r['linked_products']).split(';') if p.strip()]
-    company_counter = {}
-    for p in linked_products:
-        comps = prod_to_companies.get(p, [])
-        for c in comps:
-            company_counter[c] = company_counter.get(c, 0) + 1
-    for comp, occ in company_counter.items():
-        overlap_rows.append({
-            "scenario": scen,
-            "company": comp,
-            "occurrence_count": occ,
-            "distinct_products": len(linked_products),
-            "overlap_rank": None  # fill later
-        })
-scenario_overlap_df = pd.DataFrame(overlap_rows)
+prod_companies = company_products_df[['Product Name', 'Ticker']].dropna()
+prod_companies = (prod_companies.assign(Ticker=prod_companies['Ticker'].astype(str))
+                  .drop_duplicates()
+                  .sort_values(['Product Name', 'Ticker']))
+# One row per (scenario row, linked product), in the order products are listed
+scenario_links = scenario_expansions_df[['scenario', 'linked_products']].reset_index(drop=True)
+scenario_links['scenario_row'] = scenario_links.index
+scenario_links['linked_products'] = scenario_links['linked_products'].astype(str).str.split(';')
+scenario_links = scenario_links.explode('linked_products')
+scenario_links['linked_products'] = scenario_links['linked_products'].str.strip()
+scenario_links = scenario_links[scenario_links['linked_products'] != '']
+links_per_row = scenario_links.groupby('scenario_row').size()
+# Count company occurrences per scenario row; sort=False keeps first-seen order,
+# which the 'first' rank below uses to break ties
+scenario_overlap_df = (
+    scenario_links.merge(prod_companies, left_on='linked_products', right_on='Product Name', how='inner')
+    .groupby(['scenario_row', 'scenario', 'Ticker'], sort=False, dropna=False)
+    .size()
+    .reset_index(name='occurrence_count')
+    .rename(columns={'Ticker': 'company'})
+)
+scenario_overlap_df['distinct_products'] = scenario_overlap_df['scenario_row'].map(links_per_row)
+scenario_overlap_df = scenario_overlap_df[['scenario', 'company', 'occurrence_count', 'distinct_products']]
 if not scenario_overlap_df.empty:
     scenario_overlap_df['overlap_rank'] = scenario_overlap_df.groupby('scenario')['occurrence_count'].rank(method='first', ascending=False)
 # Skip full version
@@ -501,13 +613,8 @@ if not paths_df.empty:
     paths_compact['sort_cost'] = pd.to_numeric(paths_compact['cumulative_cost'], errors='coerce').fillna(999999)
     
     # Group by root and take top N
-    compact_paths_list = []
-    for root, group in paths_compact.groupby('root_product'):
-        top_paths = (group.sort_values(['depth', 'sort_cost', 'node_sequence'])
-                    .head(MAX_PATHS_PER_ROOT_COMPACT))
-        compact_paths_list.append(top_paths)
-    
-    paths_compact_df = pd.concat(compact_paths_list, ignore_index=True)
+    paths_compact_df = top_n_per_group(paths_compact, 'root_product', ['depth', 'sort_cost', 'node_sequence'],
+                                       [True, True, True], MAX_PATHS_PER_ROOT_COMPACT)
     
     # Convert to IDs and create separate manifest
     paths_minimal = paths_compact_df[['path_id', 'root_product', 'final_product', 'depth', 'cumulative_cost']].copy()
@@ -518,14 +625,8 @@ if not paths_df.empty:
     # Separate chain manifest (for full sequences)
     chains_manifest = paths_compact_df[['path_id', 'node_sequence']].copy()
     
-    paths_minimal_out = COMPACT_DIR / "paths_compact.csv"
-    chains_manifest_out = COMPACT_DIR / "chains_manifest.csv"
-    
-    paths_minimal.to_csv(paths_minimal_out, index=False)
-    chains_manifest.to_csv(chains_manifest_out, index=False)
-    
-    print(f"[COMPACT] Wrote {paths_minimal_out} ({len(paths_minimal)} rows)")
-    print(f"[COMPACT] Wrote {chains_manifest_out} ({len(chains_manifest)} rows)")
+    save_compact(paths_minimal, "paths_compact.csv")
+    save_compact(chains_manifest, "chains_manifest.csv")
 
 # ================ MERGED SCENARIO SUMMARY ================
 print("[COMPACT] Creating merged scenario summary...")
@@ -555,21 +656,14 @@ if not location_summary_df.empty:
         })
 
 scenario_merged_df = pd.DataFrame(scenario_merged_rows)
-scenario_merged_out = COMPACT_DIR / "scenario_summary.csv"
-scenario_merged_df.to_csv(scenario_merged_out, index=False)
-print(f"[COMPACT] Wrote {scenario_merged_out} ({len(scenario_merged_df)} rows)")
+save_compact(scenario_merged_df, "scenario_summary.csv")
 
 # ================ COMPACT INDUSTRY EXPOSURE ================
 print("[COMPACT] Creating top industry exposures...")
 
 if not industry_exposure_df.empty:
     # Keep only top 3 industries per product
-    industry_compact_list = []
-    for prod, group in industry_exposure_df.groupby('product'):
-        top_industries = group.nlargest(3, 'exposure_score')
-        industry_compact_list.append(top_industries)
-    
-    industry_compact_df = pd.concat(industry_compact_list, ignore_index=True)
+    industry_compact_df = top_n_per_group(industry_exposure_df, 'product', ['exposure_score'], [False], 3)
     
     # Convert to IDs
     industry_compact_df['product_id'] = industry_compact_df['product'].apply(lambda x: product_to_id.get(x, 0))
@@ -577,9 +671,7 @@ if not industry_exposure_df.empty:
     industry_compact_df['rank'] = industry_compact_df.groupby('product_id')['exposure_score'].rank(method='first', ascending=False)
     
     industry_compact_final = industry_compact_df[['product_id', 'industry_id', 'exposure_score', 'rank']].copy()
-    industry_compact_out = COMPACT_DIR / "industry_exposure_top.csv"
-    industry_compact_final.to_csv(industry_compact_out, index=False)
-    print(f"[COMPACT] Wrote {industry_compact_out} ({len(industry_compact_final)} rows)")
+    save_compact(industry_compact_final, "industry_exposure_top.csv")
 
 # ================ COMPACT COMPANY EXPOSURE ================
 print("[COMPACT] Creating compact company exposure...")
@@ -594,33 +686,25 @@ if not company_product_exposure_df.empty:
     company_compact['product_id'] = company_compact['product'].apply(lambda x: product_to_id.get(x, 0))
     
     company_compact_final = company_compact[['ticker_id', 'product_id', 'exposure_bucket']].copy()
-    company_compact_out = COMPACT_DIR / "company_exposure_compact.csv"
-    company_compact_final.to_csv(company_compact_out, index=False)
-    print(f"[COMPACT] Wrote {company_compact_out} ({len(company_compact_final)} rows)")
+    save_compact(company_compact_final, "company_exposure_compact.csv")
 
 # ================ COMPACT SIMILARITY (TOP 3 PER PRODUCT) ================
 print("[COMPACT] Creating top product similarities...")
 
 if not product_similarity_df.empty:
-    # Keep only top 3 similarities per product, high threshold
-    sim_filtered = product_similarity_df[product_similarity_df['similarity_score'] >= 0.65].copy()
+    # Keep only top 3 similarities per product, high threshold (rows in rank order)
+    similarity_compact_df = product_similarity_df.iloc[sim_order]
+    similarity_compact_df = similarity_compact_df[
+        (similarity_compact_df['similarity_score'] >= 0.65) & (similarity_compact_df['rank'] <= 3)
+    ].reset_index(drop=True)
     
-    similarity_compact_list = []
-    for prod, group in sim_filtered.groupby('product_a'):
-        top_sims = group.nlargest(3, 'similarity_score')
-        similarity_compact_list.append(top_sims)
-    
-    if similarity_compact_list:
-        similarity_compact_df = pd.concat(similarity_compact_list, ignore_index=True)
-        
+    if not similarity_compact_df.empty:
         # Convert to IDs
         similarity_compact_df['product_a_id'] = similarity_compact_df['product_a'].apply(lambda x: product_to_id.get(x, 0))
         similarity_compact_df['product_b_id'] = similarity_compact_df['product_b'].apply(lambda x: product_to_id.get(x, 0))
         
         similarity_compact_final = similarity_compact_df[['product_a_id', 'product_b_id', 'similarity_score']].copy()
-        similarity_compact_out = COMPACT_DIR / "similarity_top.csv"
-        similarity_compact_final.to_csv(similarity_compact_out, index=False)
-        print(f"[COMPACT] Wrote {similarity_compact_out} ({len(similarity_compact_final)} rows)")
+        save_compact(similarity_compact_final, "similarity_top.csv")
 
 print("[COMPACT] Skipping indirect exposure summary as per new requirements.")
 
@@ -628,12 +712,7 @@ print("[COMPACT] Skipping indirect exposure summary as per new requirements.")
 print("[COMPACT] Creating top scenario overlaps...")
 
 if not scenario_overlap_df.empty:
-    overlap_compact_list = []
-    for scenario, group in scenario_overlap_df.groupby('scenario'):
-        top_overlaps = group.nsmallest(5, 'overlap_rank')  # rank 1-5
-        overlap_compact_list.append(top_overlaps)
-    
-    overlap_compact_df = pd.concat(overlap_compact_list, ignore_index=True)
+    overlap_compact_df = top_n_per_group(scenario_overlap_df, 'scenario', ['overlap_rank'], [True], 5)  # rank 1-5
     
     # Convert to IDs  
     overlap_compact_df['scenario_id'] = overlap_compact_df['scenario'].apply(
@@ -642,15 +721,11 @@ if not scenario_overlap_df.empty:
     overlap_compact_df['company_id'] = overlap_compact_df['company'].apply(lambda x: company_to_id.get(x, 0))
     
     overlap_compact_final = overlap_compact_df[['scenario_id', 'company_id', 'occurrence_count', 'overlap_rank']].copy()
-    overlap_compact_out = COMPACT_DIR / "overlap_top.csv"
-    overlap_compact_final.to_csv(overlap_compact_out, index=False)
-    print(f"[COMPACT] Wrote {overlap_compact_out} ({len(overlap_compact_final)} rows)")
+    save_compact(overlap_compact_final, "overlap_top.csv")
 
 # ================ SIMPLE PRODUCT ALIASES (no IDs needed) ================
 if not product_aliases_df.empty:
-    aliases_compact_out = COMPACT_DIR / "product_aliases.csv"
-    product_aliases_df.to_csv(aliases_compact_out, index=False)
-    print(f"[COMPACT] Copied {aliases_compact_out} ({len(product_aliases_df)} rows)")
+    save_compact(product_aliases_df, "product_aliases.csv")
 
 # ================ MANIFEST ================
 manifest = {
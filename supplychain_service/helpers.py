@@ -1,9 +1,15 @@
 
-import yfinance as yf
+import numpy as np
 import pandas as pd
 import networkx as nx
 import json
-from sentence_transformers import SentenceTransformer, util
+import orjson
+import tempfile
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
+from functools import lru_cache
 
 from config import (
     COMPANY_MAIN_PRODUCTS_FILE,
@@ -24,34 +30,108 @@ DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'supply_chain.db')
 def get_db_connection():
     return sqlite3.connect(DB_PATH)
 
+# One long-lived connection shared by fetch_df (sqlite3 connections are not safe
+# for concurrent use, hence the lock); reopened by get_table when the file changes
+_DB_CONN = None
+_DB_LOCK = threading.Lock()
+
+def _reset_shared_connection():
+    global _DB_CONN
+    with _DB_LOCK:
+        if _DB_CONN is not None:
+            _DB_CONN.close()
+            _DB_CONN = None
+
 def fetch_df(query, params=None):
-    import pandas as pd
-    conn = get_db_connection()
-    try:
-        df = pd.read_sql_query(query, conn, params=params or {})
-        return df
-    finally:
-        conn.close()
+    global _DB_CONN
+    with _DB_LOCK:
+        if _DB_CONN is None:
+            _DB_CONN = sqlite3.connect(DB_PATH, check_same_thread=False)
+            # Connection-local tuning only: the reference DB is read, never written here
+            _DB_CONN.execute('PRAGMA cache_size=-65536')
+            _DB_CONN.execute('PRAGMA temp_store=MEMORY')
+        return pd.read_sql_query(query, _DB_CONN, params=params or {})
+
+# Read-mostly reference tables, loaded once per DB file version; callers must not mutate them
+_TABLE_CACHE = {}
+_DB_MTIME = None
+
+def get_table(name, fill_blanks=True, columns=None):
+    """Return ``SELECT * FROM name`` from a process-wide cache.
+
+    The cache is dropped whenever the SQLite file's mtime changes. With
+    ``fill_blanks`` NULLs are replaced by '' once at load time. ``columns``
+    (a tuple) projects the query so only those columns are read and cached.
+    """
+    global _DB_MTIME
+    mtime = os.path.getmtime(DB_PATH)
+    if mtime != _DB_MTIME:
+        _TABLE_CACHE.clear()
+        _reset_shared_connection()
+        _DB_MTIME = mtime
+    key = (name, fill_blanks, columns)
+    df = _TABLE_CACHE.get(key)
+    if df is None:
+        select = ', '.join(f'[{c}]' for c in columns) if columns else '*'
+        df = fetch_df(f'SELECT {select} FROM {name}')
+        if fill_blanks:
+            df = df.fillna('')
+        _TABLE_CACHE[key] = df
+    return df
+
+def get_lookup(name, key_column, value_column):
+    """``{key.lower(): [values in table order]}`` for a cached table.
+
+    Built once per table load (it lives in the table cache), so repeated
+    scenario lookups are a dict get instead of a lower-cased column scan.
+    """
+    df = get_table(name, fill_blanks=False, columns=(key_column, value_column))
+    key = ('lookup', name, key_column, value_column)
+    index = _TABLE_CACHE.get(key)
+    if index is None:
+        index = {}
+        for k, v in zip(df[key_column].str.lower().tolist(), df[value_column].tolist()):
+            if isinstance(k, str):
+                index.setdefault(k, []).append(v)
+        _TABLE_CACHE[key] = index
+    return index
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------------
 # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
 # ---------------------------------------------------------------------------------------------------------------------------------------------------
 from flask_login import current_user
 from openai import OpenAI
+import httpx
+
+# Optional overrides of the SDK's timeout (600s) and retry (2) defaults; unset keeps
+# them, since long non-streamed completions can legitimately take minutes and
+# every retry re-issues a billed request
+OPENAI_TIMEOUT = os.environ.get("OPENAI_TIMEOUT")
+OPENAI_CONNECT_TIMEOUT = os.environ.get("OPENAI_CONNECT_TIMEOUT")
+OPENAI_MAX_RETRIES = os.environ.get("OPENAI_MAX_RETRIES")
+
+def _openai_client_options():
+    options = {}
+    if OPENAI_TIMEOUT is not None or OPENAI_CONNECT_TIMEOUT is not None:
+        read_timeout = float(OPENAI_TIMEOUT) if OPENAI_TIMEOUT is not None else 600.0
+        connect_timeout = float(OPENAI_CONNECT_TIMEOUT) if OPENAI_CONNECT_TIMEOUT is not None else 5.0
+        options["timeout"] = httpx.Timeout(read_timeout, connect=connect_timeout)
+    if OPENAI_MAX_RETRIES is not None:
+        options["max_retries"] = int(OPENAI_MAX_RETRIES)
+    return options
+
+@lru_cache(maxsize=64)
+def _openai_client(api_key):
+    # One client per key so its HTTP connection pool is reused across requests
+    return OpenAI(api_key=api_key, **_openai_client_options())
 
 def get_openai_client():
     """Get OpenAI client using current user's API key"""
     if not current_user or not current_user.api_key:
         raise ValueError("No API key found for current user")
-    return OpenAI(api_key=current_user.api_key)
+    return _openai_client(current_user.api_key)
 
-def chat_with_gpt(user_input: str, history=None, functions=None):
-    """Chat with GPT using the current user's API key"""
-    if history is None:
-        history = []
-    
-    client = get_openai_client()
-    
+def _chat_request_kwargs(user_input, history, functions):
     # Build conversation history
     messages = list(history)
     if user_input:
@@ -72,35 +152,211 @@ def chat_with_gpt(user_input: str, history=None, functions=None):
         # For scenario tracing, we want structured function calls
         kwargs["functions"] = FUNCTION_DEFINITIONS
         kwargs["function_call"] = "auto"
+    return kwargs
+
+def _run_function_call(content, function_name, arguments):
+    """Execute a function GPT asked for; returns the (content, artifact, artifact_type) reply."""
+    function_args = orjson.loads(arguments)
+    if function_name == "get_stock_history":
+        result = get_stock_history(**function_args)
+        return content or "", result, "stock_chart"
+    elif function_name == "get_products_by_company":
+        result = get_products_by_company(**function_args)
+        return content or "", result.to_dict('records'), "company_products"
+    elif function_name == "trace_supply_chain":
+        result = trace_supply_chain(**function_args)
+        return content or "", result, "supply_chain_trace"
+    elif function_name == "scenario_trace":
+        result = scenario_trace(**function_args)
+        return content or "", result, "scenario_analysis"
+    return content, None, None
+
+def _cache_owner():
+    """Id of the current user, or None when replies can't be attributed to one."""
+    return getattr(current_user, 'id', None) if current_user else None
+
+def _cached_reply(user_input, history, functions):
+    """(prompt_embedding, cached_reply) for cacheable prompts, (None, None) otherwise.
+
+    Stand-alone prompts (no history, default functions) can be answered from the
+    semantic cache when the same user asked a near-identical prompt before.
+    """
+    owner = _cache_owner()
+    if user_input and not history and not functions and SEMANTIC_CACHE_ENABLED and owner is not None:
+        prompt_embedding = _get_model().encode(user_input, normalize_embeddings=True)
+        return prompt_embedding, get_semantic_cache().lookup(owner, prompt_embedding)
+    return None, None
+
+def chat_with_gpt(user_input: str, history=None, functions=None):
+    """Chat with GPT using the current user's API key"""
+    if history is None:
+        history = []
+
+    prompt_embedding, cached = _cached_reply(user_input, history, functions)
+    if cached is not None:
+        return cached
+
+    client = get_openai_client()
+    kwargs = _chat_request_kwargs(user_input, history, functions)
     
     try:
         response = client.chat.completions.create(**kwargs)
         
         message = response.choices[0].message
         
+        reply = (message.content, None, None)
         # Check if GPT called a function
         if hasattr(message, 'function_call') and message.function_call:
-            function_name = message.function_call.name
-            function_args = json.loads(message.function_call.arguments)
-            
-            # Execute the function
-            if function_name == "get_stock_history":
-                result = get_stock_history(**function_args)
-                return message.content or "", result, "stock_chart"
-            elif function_name == "get_products_by_company":
-                result = get_products_by_company(**function_args)
-                return message.content or "", result.to_dict('records'), "company_products"
-            elif function_name == "trace_supply_chain":
-                result = trace_supply_chain(**function_args)
-                return message.content or "", result, "supply_chain_trace"
-            elif function_name == "scenario_trace":
-                result = scenario_trace(**function_args)
-                return message.content or "", result, "scenario_analysis"
-        
-        return message.content, None, None
-        
+            reply = _run_function_call(message.content, message.function_call.name, message.function_call.arguments)
+
     except Exception as e:
         raise Exception(f"OpenAI API error: {str(e)}")
+
+    if prompt_embedding is not None:
+        get_semantic_cache().add(_cache_owner(), prompt_embedding, reply)
+    return reply
+
+# ──────────────────────────── Semantic response cache ────────────────────────────────
+# Opt-in: replies carry user-specific artifacts, so entries are partitioned per user
+# and only near-duplicate prompts (cosine >= threshold on MiniLM) are served
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE", "0") != "0"
+SEMANTIC_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'data', 'llm_cache.db')
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+# Replies can embed live data (stock prices), so entries expire after a day by default
+SEMANTIC_CACHE_TTL = float(os.environ.get("SEMANTIC_CACHE_TTL", 24 * 3600))
+
+class SemanticCache:
+    """LRU cache of chat replies keyed by owner and normalized prompt embedding.
+
+    A lookup hits when the cosine similarity to a live prompt stored for the same
+    owner is at least ``threshold``. Entries are kept in memory as one float32
+    matrix (rebuilt lazily after evictions) and persisted to a small SQLite file
+    so a restarted process starts warm; prompt text itself is never stored, and
+    expired rows are purged from the file on load. ``max_entries <= 0`` disables
+    the cache.
+    """
+
+    def __init__(self, path, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, ttl=SEMANTIC_CACHE_TTL):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # entry id -> (owner, embedding, created_at, reply), least recently used first
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._matrix_ids = []
+        self._matrix_owners = None
+        self._matrix_created = None
+        if max_entries > 0:
+            self._load()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(llm_cache)")}
+        if columns and 'owner' not in columns:
+            # Entries from before per-user partitioning can't be attributed; drop them
+            with conn:
+                conn.execute("DROP TABLE llm_cache")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "id INTEGER PRIMARY KEY, owner TEXT, embedding BLOB, response TEXT, created_at REAL)"
+        )
+        return conn
+
+    def _load(self):
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+                rows = conn.execute(
+                    "SELECT id, owner, embedding, response, created_at FROM llm_cache "
+                    "ORDER BY id DESC LIMIT ?",
+                    (self.max_entries,),
+                ).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"[Warning] Semantic cache not loaded: {e}")
+            return
+        for entry_id, owner, embedding, response, created_at in reversed(rows):
+            self._entries[entry_id] = (owner, np.frombuffer(embedding, dtype=np.float32),
+                                       created_at, tuple(orjson.loads(response)))
+
+    def _rebuild_matrix(self):
+        self._matrix_ids = list(self._entries)
+        entries = [self._entries[i] for i in self._matrix_ids]
+        self._matrix = np.vstack([e[1] for e in entries])
+        self._matrix_owners = np.array([e[0] for e in entries], dtype=object)
+        self._matrix_created = np.array([e[2] for e in entries], dtype=np.float64)
+
+    def lookup(self, owner, embedding):
+        """Return the cached (content, artifact, artifact_type) reply for a similar prompt by ``owner``, or None."""
+        owner = str(owner)
+        with self._lock:
+            if not self._entries:
+                return None
+            if self._matrix is None:
+                self._rebuild_matrix()
+            scores = self._matrix @ np.asarray(embedding, dtype=np.float32)
+            # Only live entries of the same owner compete for the best match
+            live = (self._matrix_owners == owner) & (self._matrix_created >= time.time() - self.ttl)
+            scores = np.where(live, scores, -np.inf)
+            best = int(scores.argmax())
+            if scores[best] < self.threshold:
+                return None
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            return self._entries[entry_id][3]
+
+    def add(self, owner, embedding, reply):
+        if self.max_entries <= 0:
+            return
+        try:
+            # NaN/inf become null; numpy scalars (e.g. in product records) serialize natively
+            response = orjson.dumps(reply, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        except TypeError:
+            return  # artifact not JSON-serializable; don't cache it
+        owner = str(owner)
+        embedding = np.asarray(embedding, dtype=np.float32)
+        created_at = time.time()
+        with self._lock:
+            evicted = []
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        entry_id = conn.execute(
+                            "INSERT INTO llm_cache (owner, embedding, response, created_at) VALUES (?, ?, ?, ?)",
+                            (owner, embedding.tobytes(), response, created_at),
+                        ).lastrowid
+                        while self._entries and len(self._entries) >= self.max_entries:
+                            evicted.append(self._entries.popitem(last=False)[0])
+                        conn.executemany("DELETE FROM llm_cache WHERE id = ?", [(i,) for i in evicted])
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"[Warning] Semantic cache entry not stored: {e}")
+                return
+            self._entries[entry_id] = (owner, embedding, created_at, tuple(orjson.loads(response)))
+            if evicted or self._matrix is None:
+                self._matrix = None
+            else:
+                self._matrix = np.vstack([self._matrix, embedding])
+                self._matrix_ids.append(entry_id)
+                self._matrix_owners = np.append(self._matrix_owners, np.array([owner], dtype=object))
+                self._matrix_created = np.append(self._matrix_created, created_at)
+
+_SEMANTIC_CACHE = None
+
+def get_semantic_cache():
+    global _SEMANTIC_CACHE
+    if _SEMANTIC_CACHE is None:
+        _SEMANTIC_CACHE = SemanticCache(SEMANTIC_CACHE_PATH)
+    return _SEMANTIC_CACHE
 # ---------------------------------------------------------------------------------------------------------------------------------------------------
 
 # ──────────────────────────── Functions that LLM can use ────────────────────────────────
@@ -196,8 +452,27 @@ FUNCTION_DEFINITIONS = [
 
 # ──────────────────────────── Artifact-related Helper Functions ────────────────────────────────
 
-def get_stock_history(ticker: str, period: str = "1y", interval: str = "1d"):
-    ticker = ticker.upper()
+# Downloaded Date/Close series are cached on disk per (ticker, period, interval);
+# daily-or-coarser bars are reused for a day, intraday bars for 15 minutes
+STOCK_CACHE_DIR = Path(os.path.dirname(__file__)) / 'data' / 'stock_cache'
+STOCK_CACHE_TTL = os.environ.get("STOCK_CACHE_TTL")
+INTRADAY_INTERVALS = {"1h", "30m", "15m"}
+
+def _stock_cache_ttl(interval):
+    if STOCK_CACHE_TTL is not None:
+        return float(STOCK_CACHE_TTL)
+    return 15 * 60 if interval in INTRADAY_INTERVALS else 24 * 3600
+
+def _fetch_close_history(ticker, period, interval):
+    """Date/Close frame for a ticker, served from the Parquet cache while fresh."""
+    cache_path = STOCK_CACHE_DIR / f"{ticker.replace('/', '_')}_{period}_{interval}.parquet"
+    if cache_path.exists() and time.time() - cache_path.stat().st_mtime < _stock_cache_ttl(interval):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception as e:
+            print(f"[Warning] Ignoring unreadable stock cache {cache_path.name}: {e}")
+
+    import yfinance as yf  # deferred: only needed on a stock cache miss
     stock  = yf.Ticker(ticker)
     hist   = stock.history(period=period, interval=interval)
 
@@ -205,9 +480,28 @@ def get_stock_history(ticker: str, period: str = "1y", interval: str = "1d"):
         print(f"[Warning] No data for {ticker}")
 
     hist = hist.reset_index()
-    hist['Date'] = hist['Date'].dt.strftime('%Y-%m-%d')
+    # Drop the exchange tz (keeping local wall time) and format all dates in one vectorized call
+    dates = hist['Date']
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    hist['Date'] = np.datetime_as_string(dates.to_numpy(dtype='datetime64[D]'), unit='D')
+    hist = hist[['Date', 'Close']]
 
-    prices = hist[['Date', 'Close']].to_dict(orient='records')
+    if not hist.empty:
+        try:
+            STOCK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            hist.to_parquet(cache_path, index=False)
+        except Exception as e:
+            print(f"[Warning] Could not cache stock history for {ticker}: {e}")
+    return hist
+
+def get_stock_history(ticker: str, period: str = "1y", interval: str = "1d"):
+    ticker = ticker.upper()
+    hist = _fetch_close_history(ticker, period, interval)
+
+    # Zip the two column lists instead of going through to_dict's per-row machinery
+    prices = [{'Date': d, 'Close': c}
+              for d, c in zip(hist['Date'].tolist(), hist['Close'].astype(float).tolist())]
 
     return {
         "sub_type": "stock_prices",
@@ -219,128 +513,230 @@ def get_stock_history(ticker: str, period: str = "1y", interval: str = "1d"):
         "interval": interval
     }
 
+@lru_cache(maxsize=1)
+def _load_products(csv_mtime):
+    """Master product table with share_pct cleaned, plus {ticker: row positions}.
+
+    Cached per version of the CSV (``csv_mtime`` is the cache key). The cleaned
+    table is also written next to the CSV as ``*.clean.parquet`` (distinct from
+    the raw copy generate_precomputed keeps), which later processes load instead
+    of parsing and cleaning the CSV again.
+    """
+    parquet_path = COMPANY_MAIN_PRODUCTS_FILE.with_suffix('.clean.parquet')
+    df = None
+    if parquet_path.exists() and parquet_path.stat().st_mtime >= csv_mtime:
+        try:
+            df = pd.read_parquet(parquet_path, memory_map=True)
+        except Exception as e:
+            print(f"[Warning] Falling back to CSV for {COMPANY_MAIN_PRODUCTS_FILE.name}: {e}")
+    if df is None:
+        df = pd.read_csv(COMPANY_MAIN_PRODUCTS_FILE)
+        if 'share_pct' in df.columns:
+            df['share_pct'] = (
+                df['share_pct'].astype(str)
+                .str.replace('%', '', regex=False)
+                .str.replace(',', '', regex=False)
+                .str.strip()
+            )
+            df['share_pct'] = pd.to_numeric(df['share_pct'], errors='coerce')
+        tmp_path = None
+        try:
+            # Write to a unique temp file and rename, so readers never see a partial copy
+            fd, tmp_path = tempfile.mkstemp(dir=parquet_path.parent, suffix='.parquet.tmp')
+            os.close(fd)
+            df.to_parquet(tmp_path, compression='snappy', index=False)
+            os.replace(tmp_path, parquet_path)
+        except Exception as e:
+            # pyarrow missing or read-only data dir: keep serving from the CSV
+            if tmp_path:
+                Path(tmp_path).unlink(missing_ok=True)
+            print(f"[Warning] Could not write Parquet copy of {COMPANY_MAIN_PRODUCTS_FILE.name}: {e}")
+    return df, df.groupby('Ticker', sort=False).indices
+
 def get_products_by_company(ticker: str):
-    df = pd.read_csv(COMPANY_MAIN_PRODUCTS_FILE)
-    out = df[df["Ticker"] == ticker].copy()
-    if 'share_pct' in out.columns:
-        out['share_pct'] = (
-            out['share_pct'].astype(str)
-            .str.replace('%', '', regex=False)
-            .str.replace(',', '', regex=False)
-            .str.strip()
+    df, ticker_index = _load_products(os.path.getmtime(COMPANY_MAIN_PRODUCTS_FILE))
+    rows = ticker_index.get(ticker)
+    return df.iloc[rows] if rows is not None else df.iloc[:0]
+
+def df_records(df):
+    """``df.to_dict(orient='records')`` built by zipping column lists (much cheaper per row)."""
+    columns = df.columns.tolist()
+    return [dict(zip(columns, row)) for row in zip(*(df[c].tolist() for c in columns))]
+
+def load_portfolio(portfolio_path: str) -> dict:
+    """Read a portfolio JSON file ({"holdings": [{"ticker": ..., "weight": ...}]}).
+
+    The parsed file is cached until it changes on disk; callers must not mutate it.
+    """
+    return _load_portfolio_cached(portfolio_path, os.path.getmtime(portfolio_path))
+
+@lru_cache(maxsize=64)
+def _load_portfolio_cached(portfolio_path, mtime):
+    with open(portfolio_path, 'r') as f:
+        return json.load(f)
+
+def _add_input_edges(G, inputs_df):
+    """Add Input Product -> Main Product Name edges for a whole tier table at once."""
+    G.add_edges_from(
+        (src, dst, {'percentage_cost': None if pd.isna(cost) else cost})
+        for src, dst, cost in zip(
+            inputs_df['Input Product'].str.lower().tolist(),
+            inputs_df['Main Product Name'].str.lower().tolist(),
+            inputs_df['Percentage Cost'].tolist(),
         )
-        out['share_pct'] = pd.to_numeric(out['share_pct'], errors='coerce')
-    return out
+    )
 
-def trace_supply_chain(product: str, depth: int = 2, portfolio_path: str = None):
-    product = product.strip().lower()
-    
-    # 1) Load all data from SQLite
+@lru_cache(maxsize=1)
+def _build_graph(db_mtime):
+    """Supply chain graph for one version of the DB file (``db_mtime`` is the cache key)."""
     # ---------------------------------------------------------------------------------------------------------------------------------------------------
     # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
     # ---------------------------------------------------------------------------------------------------------------------------------------------------
-    company_main_products_df = fetch_df('SELECT * FROM company_main_products').fillna('')
-    tier_1_input_products_df = fetch_df('SELECT * FROM tier_1_input_products').fillna('')
-    tier_2_input_products_df = fetch_df('SELECT * FROM tier_2_input_products').fillna('')
-    tier_1_locations_df = fetch_df('SELECT * FROM tier_1_locations').fillna('')
-    tier_2_locations_df = fetch_df('SELECT * FROM tier_2_locations').fillna('')
+    company_main_products_df = get_table('company_main_products')
+    edge_columns = ('Input Product', 'Main Product Name', 'Percentage Cost')
+    tier_1_input_products_df = get_table('tier_1_input_products', columns=edge_columns)
+    tier_2_input_products_df = get_table('tier_2_input_products', columns=edge_columns)
     # ---------------------------------------------------------------------------------------------------------------------------------------------------
 
-
-    # 2) Create a directed graph
     G = nx.DiGraph()
 
-    # Add nodes and edges from Tier 2 to Tier 1
-    for _, row in tier_2_input_products_df.iterrows():
-        cost = row['Percentage Cost']
-        if pd.isna(cost):
-            cost = None
-        G.add_edge(row['Input Product'].lower(), row['Main Product Name'].lower(), percentage_cost=cost)
-
-    # Add nodes and edges from Tier 1 to Main Products
-    for _, row in tier_1_input_products_df.iterrows():
-        cost = row['Percentage Cost']
-        if pd.isna(cost):
-            cost = None
-        G.add_edge(row['Input Product'].lower(), row['Main Product Name'].lower(), percentage_cost=cost)
-
-    # Add company information to nodes
-    # Add company information to nodes
-    for _, row in company_main_products_df.iterrows():
-        node_name = row['Product Name'].lower()
-        if node_name in G:
-            ticker = row['Ticker'] if not pd.isna(row['Ticker']) else None
-            industry = row['Industry'] if not pd.isna(row['Industry']) else None
-            
-            G.nodes[node_name].setdefault('companies', [])
-            if ticker and ticker not in G.nodes[node_name]['companies']:
-                G.nodes[node_name]['companies'].append(ticker)
-            G.nodes[node_name]['industry'] = industry
-
-            # Adding share_pct
-            if 'share_pct' in row and pd.notna(row['share_pct']) and ticker:
-                G.nodes[node_name].setdefault('share_pct_by_company', {})
-                G.nodes[node_name]['share_pct_by_company'][ticker] = float(row['share_pct'])
+    # Add nodes and edges from Tier 2 to Tier 1, then from Tier 1 to Main Products
+    _add_input_edges(G, tier_2_input_products_df)
+    _add_input_edges(G, tier_1_input_products_df)
 
-    # 3) Trace the supply chain
-    if not G.has_node(product):
-        return {'error': f'Product "{product}" not in graph'}
+    # Add company information to nodes: per product, the distinct tickers in table
+    # order, the industry of its last row and (when present) share_pct per ticker
+    products = company_main_products_df.assign(node=company_main_products_df['Product Name'].str.lower())
+    products = products[products['node'].isin(list(G))]
+    with_ticker = products[products['Ticker'].notna() & (products['Ticker'] != '')]
+    companies = with_ticker.drop_duplicates(['node', 'Ticker']).groupby('node', sort=False)['Ticker'].agg(list)
+    industries = products.drop_duplicates('node', keep='last').set_index('node')['Industry']
+    nx.set_node_attributes(G, {node: companies.get(node, []) for node in industries.index}, 'companies')
+    nx.set_node_attributes(G, industries.where(industries.notna(), None).to_dict(), 'industry')
+
+    # Adding share_pct
+    if 'share_pct' in products.columns:
+        shares = with_ticker.assign(share_pct=pd.to_numeric(with_ticker['share_pct'], errors='coerce'))
+        shares = shares[shares['share_pct'].notna()].drop_duplicates(['node', 'Ticker'], keep='last')
+        share_pct_by_company = {}
+        for node, ticker, share in zip(shares['node'].tolist(), shares['Ticker'].tolist(), shares['share_pct'].tolist()):
+            share_pct_by_company.setdefault(node, {})[ticker] = float(share)
+        nx.set_node_attributes(G, share_pct_by_company, 'share_pct_by_company')
 
-    # Find all leaf nodes (nodes with out_degree 0) which are the final products
+    # Leaf nodes (out_degree 0) are the final products; remember their graph order
     leaf_nodes = [node for node, out_degree in G.out_degree() if out_degree == 0]
+    G.graph['leaf_position'] = {node: i for i, node in enumerate(leaf_nodes)}
+    return G
 
-    all_paths = []
-    for target_node in leaf_nodes:
-        try:
-            # Check if a path exists before calling all_simple_paths
-            if nx.has_path(G, product, target_node):
-                paths = list(nx.all_simple_paths(G, source=product, target=target_node, cutoff=depth))
-                all_paths.extend(paths)
-        except nx.NodeNotFound:
-            # This can happen if the source product is not in the graph, handled above.
-            # Or if target_node is somehow not in the graph, which shouldn't happen with this logic.
+def _sink_paths(G, source, depth):
+    """Single iterative DFS from ``source`` collecting every simple path of at most
+    ``depth`` edges that ends at a leaf node.
+
+    Successors are visited in adjacency order, so paths to any one leaf come out in
+    nx.all_simple_paths order (a leaf source yields the one-node path, as there).
+    """
+    if G.out_degree(source) == 0:
+        return [[source]]
+    paths = []
+    if depth < 1:
+        return paths
+    path = [source]
+    on_path = {source}
+    stack = [iter(G.adj[source])]
+    while stack:
+        nxt = next(stack[-1], None)
+        if nxt is None:
+            stack.pop()
+            on_path.discard(path.pop())
             continue
+        if nxt in on_path:
+            continue
+        if not G.adj[nxt]:
+            paths.append(path + [nxt])
+        elif len(path) < depth:
+            path.append(nxt)
+            on_path.add(nxt)
+            stack.append(iter(G.adj[nxt]))
+    return paths
+
+# Requests run in a threadpool; lru_cache does not dedupe concurrent misses, so a
+# cold start would otherwise build the graph once per in-flight request
+_GRAPH_LOCK = threading.Lock()
+
+def _graph_for(db_mtime):
+    with _GRAPH_LOCK:
+        return _build_graph(db_mtime)
+
+def get_graph():
+    """Return the cached supply chain graph, rebuilt when the SQLite file changes.
+
+    The graph is shared between requests and must be treated as read-only.
+    """
+    return _graph_for(os.path.getmtime(DB_PATH))
+
+@lru_cache(maxsize=128)
+def _trace_impl(product, depth, db_mtime):
+    """Portfolio-independent part of a trace: causal chains, nodes and edges.
+
+    Memoized per (product, depth) and DB version, so commodities shared between
+    scenarios are traced once; the returned structures are shared and read-only.
+    """
+    # 1) Load the (cached) supply chain graph
+    G = _graph_for(db_mtime)
+
+    # 3) Trace the supply chain
+    if not G.has_node(product):
+        return {'error': f'Product "{product}" not in graph'}
+
+    # Every simple path from the product to a leaf (final product) within depth,
+    # grouped by leaf in graph order as the per-leaf all_simple_paths loop returned them
+    leaf_position = G.graph['leaf_position']
+    all_paths = sorted(_sink_paths(G, product, depth), key=lambda path: leaf_position[path[-1]])
 
     if not all_paths:
         return {'error': f'No supply chain paths found for "{product}" within depth {depth}.'}
 
+    # Node attributes depend only on the node name, so read each distinct node once
+    node_attrs = {}
+    for path in all_paths:
+        for node_name in path:
+            if node_name not in node_attrs:
+                attrs = G.nodes[node_name]
+                node_attrs[node_name] = {
+                    "industry": attrs.get('industry', 'N/A'),
+                    "companies": attrs.get('companies', ['N/A']),
+                    "share_pct_by_company": attrs.get('share_pct_by_company', {}),
+                    "location": attrs.get('location', None),
+                    "lat": attrs.get('lat', None),
+                    "lng": attrs.get('lng', None)
+                }
+
     causal_chains = []
     nodes = {}
     edges = []
     node_counter = 1
     for path in all_paths:
         chain = []
-        for i in range(len(path)):
-            node_name = path[i]
+        last = len(path) - 1
+        for i, node_name in enumerate(path):
             node_id = f"node_{node_counter}"
             node_counter += 1
-            node_type = 'product' if i == 0 else ('company' if i == len(path)-1 else 'intermediate')
-            share_map = G.nodes.get(node_name, {}).get('share_pct_by_company', {})
-            node_data = {
-                "id": node_id,
-                "label": node_name,
-                "type": node_type,
-                "industry": G.nodes.get(node_name, {}).get('industry', 'N/A'),
-                "companies": G.nodes.get(node_name, {}).get('companies', ['N/A']),
-                "share_pct_by_company": share_map,
-                "location": G.nodes.get(node_name, {}).get('location', None),
-                "lat": G.nodes.get(node_name, {}).get('lat', None),
-                "lng": G.nodes.get(node_name, {}).get('lng', None)
-            }
+            node_type = 'product' if i == 0 else ('company' if i == last else 'intermediate')
+            # One entry per path position: type and popup depend on where the node sits
+            node_data = {"id": node_id, "label": node_name, "type": node_type, **node_attrs[node_name]}
             nodes[node_id] = node_data
             if i > 0:
                 prev_node_id = f"node_{node_counter-2}"
-                edge_data = G.get_edge_data(path[i-1], node_name)
-                cost_value = edge_data.get('percentage_cost', 'N/A') if edge_data else 'N/A'
+                edge_data = G.adj[path[i-1]][node_name]
+                cost_value = edge_data.get('percentage_cost', 'N/A')
                 edges.append({
                     "from": prev_node_id,
                     "to": node_id,
-                    "label": edge_data.get('product_link', '') if edge_data else '',
+                    "label": edge_data.get('product_link', ''),
                     "effect_type": 'Direct' if i == 1 else 'Indirect',
                     "cost_impact": cost_value
                 })
             # For pop-up data
-            popup = {}
             if node_type == 'product':
                 popup = {"name": node_name, "produced_by": node_data["companies"]}
             elif node_type == 'company':
@@ -352,23 +748,34 @@ def trace_supply_chain(product: str, depth: int = 2, portfolio_path: str = None)
         if chain:
             causal_chains.append(chain)
 
+    return {'causal_chains': causal_chains, 'nodes': list(nodes.values()), 'edges': edges}
+
+def trace_supply_chain(product: str, depth: int = 2, portfolio_path: str = None, portfolio: dict = None):
+    product = product.strip().lower()
+
+    # 1-3) Trace the supply chain on the cached graph (memoized per product/depth)
+    trace = _trace_impl(product, depth, os.path.getmtime(DB_PATH))
+    if 'error' in trace:
+        return dict(trace)
+    causal_chains = trace['causal_chains']
+
     # 4) Calculate portfolio exposure
     portfolio_exposure = {}
-    if portfolio_path:
-        with open(portfolio_path, 'r') as f:
-            portfolio = json.load(f)
-            portfolio_tickers = {ticker['ticker']: ticker['weight'] for ticker in portfolio['holdings']}
-            
-            for chain in causal_chains:
-                for step in chain:
-                    # Access companies from the new node structure
-                    companies = step.get('companies', [])
-                    if isinstance(companies, list):
-                        for company in companies:
-                            if company and company != 'N/A' and company in portfolio_tickers:
-                                if company not in portfolio_exposure:
-                                    portfolio_exposure[company] = {'weight': portfolio_tickers[company], 'chains': []}
-                                portfolio_exposure[company]['chains'].append(chain)
+    if portfolio is None and portfolio_path:
+        portfolio = load_portfolio(portfolio_path)
+    if portfolio:
+        portfolio_tickers = {ticker['ticker']: ticker['weight'] for ticker in portfolio['holdings']}
+
+        for chain in causal_chains:
+            for step in chain:
+                # Access companies from the new node structure
+                companies = step.get('companies', [])
+                if isinstance(companies, list):
+                    for company in companies:
+                        if company and company != 'N/A' and company in portfolio_tickers:
+                            if company not in portfolio_exposure:
+                                portfolio_exposure[company] = {'weight': portfolio_tickers[company], 'chains': []}
+                            portfolio_exposure[company]['chains'].append(chain)
 
     # 5) Generate narrative summary
     narrative_summary = generate_narrative_summary(product, causal_chains, portfolio_exposure)
@@ -377,8 +784,8 @@ def trace_supply_chain(product: str, depth: int = 2, portfolio_path: str = None)
         'product': product,
         'trace_depth': depth,
         'causal_chains': causal_chains,
-        'nodes': list(nodes.values()),
-        'edges': edges,
+        'nodes': trace['nodes'],
+        'edges': trace['edges'],
         'portfolio_exposure': portfolio_exposure,
         'narrative_summary': narrative_summary
     }
@@ -386,16 +793,16 @@ def trace_supply_chain(product: str, depth: int = 2, portfolio_path: str = None)
 def generate_narrative_summary(product, causal_chains, portfolio_exposure=None):
     if not causal_chains:
         return f"No supply chain paths found for {product}."
-    summary = f"Supply chain analysis for **{product}** reveals the following key paths:\n\n"
+    parts = [f"Supply chain analysis for **{product}** reveals the following key paths:\n\n"]
     for i, chain in enumerate(causal_chains[:5]):  # Limit to 5 paths for brevity
-        summary += f"**Path {i+1}:**\n"
+        parts.append(f"**Path {i+1}:**\n")
         path_parts = []
         for step in chain:
             # Use the label (node name) and first company if available
             company_str = f" ({step.get('companies', ['N/A'])[0]})" if step.get('companies') and step.get('companies')[0] != 'N/A' else ""
             path_parts.append(f"{step['label']}{company_str}")
         path_str = " → ".join(path_parts)
-        summary += f"*   {path_str}\n"
+        parts.append(f"*   {path_str}\n")
         # Calculate cost impact from edges if available
         total_cost_impact = 1
         for j, step in enumerate(chain):
@@ -404,14 +811,15 @@ def generate_narrative_summary(product, causal_chains, portfolio_exposure=None):
                 cost = step.get('popup', {}).get('cost_impact', 0)
                 if isinstance(cost, (int, float)) and cost != 'N/A':
                     total_cost_impact *= (cost / 100.0)
-        summary += f"*   **Estimated Cost Impact on Final Product:** {total_cost_impact:.2%}\n"
-        summary += f"*   **Final Industry:** {chain[-1].get('industry', 'N/A')}\n\n"
+        parts.append(f"*   **Estimated Cost Impact on Final Product:** {total_cost_impact:.2%}\n")
+        parts.append(f"*   **Final Industry:** {chain[-1].get('industry', 'N/A')}\n\n")
     if len(causal_chains) > 5:
-        summary += f"And {len(causal_chains) - 5} more paths.\n"
+        parts.append(f"And {len(causal_chains) - 5} more paths.\n")
     if portfolio_exposure:
-        summary += "\n**Portfolio Exposure:**\n"
+        parts.append("\n**Portfolio Exposure:**\n")
         for ticker, data in portfolio_exposure.items():
-            summary += f"*   **{ticker}:** {data['weight']}% of portfolio. Exposed through {len(data['chains'])} supply chain(s).\n"
+            parts.append(f"*   **{ticker}:** {data['weight']}% of portfolio. Exposed through {len(data['chains'])} supply chain(s).\n")
+    return "".join(parts)
 
 # ──────────────────────────── Scenario Tracing-related Helper Functions ────────────────────────────────
 # def clean_nan_from_json(obj):
@@ -436,31 +844,68 @@ def generate_narrative_summary(product, causal_chains, portfolio_exposure=None):
 #     except Exception:
 #         return False
 
-def resolve_term_to_codes(term: str):
-    """Resolves a natural language term to a list of relevant codes using the SQLite DB."""
+# MiniLM model and knowledge-base phrase embeddings, loaded on first use and kept
+# for the life of the process (see _get_resolver)
+_ST_MODEL = None
+_KB_DF = None
+_KB_EMB = None
+_KB_ROWS = None
+
+# SENTENCE_BACKEND=onnx (needs sentence-transformers[onnx]) runs MiniLM on ONNX Runtime;
+# SENTENCE_MODEL_FILE picks an exported variant, e.g. onnx/model_qint8_avx512_vnni.onnx
+SENTENCE_BACKEND = os.environ.get("SENTENCE_BACKEND", "torch")
+SENTENCE_MODEL_FILE = os.environ.get("SENTENCE_MODEL_FILE")
+
+def _get_model():
+    """Shared all-MiniLM-L6-v2 instance (term resolver and semantic response cache)."""
+    global _ST_MODEL
+    if _ST_MODEL is None:
+        # Imported here so workers that never resolve terms don't pay the torch import at startup
+        from sentence_transformers import SentenceTransformer
+        if SENTENCE_BACKEND == "torch":
+            _ST_MODEL = SentenceTransformer('all-MiniLM-L6-v2')
+        else:
+            model_kwargs = {"file_name": SENTENCE_MODEL_FILE} if SENTENCE_MODEL_FILE else None
+            _ST_MODEL = SentenceTransformer('all-MiniLM-L6-v2', backend=SENTENCE_BACKEND, model_kwargs=model_kwargs)
+    return _ST_MODEL
+
+def _get_resolver():
+    """Load the sentence model once and encode every knowledge-base phrase in one batch.
+
+    Returns (model, knowledge_base_df, phrase_embeddings, phrase_rows) where
+    phrase_rows[i] is the knowledge_base_df row position of phrase i. Phrases are
+    re-encoded only when the knowledge base table is reloaded.
+    """
+    global _KB_DF, _KB_EMB, _KB_ROWS
+    model = _get_model()
     # -------------------------------- To be turned into real db calls --------------------------------
-    knowledge_base_df = fetch_df('SELECT * FROM knowledge_base')
+    knowledge_base_df = get_table('knowledge_base', fill_blanks=False)
     # -------------------------------- To be turned into real db calls --------------------------------
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    if knowledge_base_df is not _KB_DF:
+        phrases, rows = [], []
+        for i, (term, synonyms) in enumerate(zip(knowledge_base_df['Term'].tolist(), knowledge_base_df['Synonyms'].tolist())):
+            for phrase in [term] + (synonyms.split(',') if isinstance(synonyms, str) and synonyms else []):
+                phrases.append(phrase.strip())
+                rows.append(i)
+        _KB_EMB = model.encode(phrases, batch_size=128, convert_to_numpy=True,
+                               normalize_embeddings=True, show_progress_bar=False)
+        _KB_DF, _KB_ROWS = knowledge_base_df, rows
+    return model, _KB_DF, _KB_EMB, _KB_ROWS
 
-    term_embedding = model.encode(term, convert_to_tensor=True)
-    
-    best_match = None
-    max_similarity = -1
-
-    for index, row in knowledge_base_df.iterrows():
-        synonyms = row['Synonyms']
-        if pd.isna(synonyms):
-            synonyms = ''
-        phrases = [row['Term']] + (synonyms.split(',') if synonyms else [])
-        for phrase in phrases:
-            phrase_embedding = model.encode(phrase.strip(), convert_to_tensor=True)
-            similarity = util.pytorch_cos_sim(term_embedding, phrase_embedding).item()
-            if similarity > max_similarity:
-                max_similarity = similarity
-                best_match = row
-
-    if best_match is not None and max_similarity > 0.5: # Threshold for a good match
+def resolve_term_to_codes(term: str):
+    """Resolves a natural language term to a list of relevant codes using the SQLite DB."""
+    model, knowledge_base_df, kb_embeddings, kb_rows = _get_resolver()
+    if not kb_rows:
+        return {}
+
+    term_embedding = model.encode(term, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+    # Cosine similarity against every phrase at once; argmax keeps the first best phrase
+    similarities = kb_embeddings @ term_embedding
+    best_phrase = int(similarities.argmax())
+    max_similarity = float(similarities[best_phrase])
+    best_match = knowledge_base_df.iloc[kb_rows[best_phrase]]
+
+    if max_similarity > 0.5: # Threshold for a good match
         return {
             "type": best_match['Type'],
             "hs_codes": [code.strip() for code in str(best_match['HS_Codes']).split(',')] if pd.notna(best_match['HS_Codes']) else [],
@@ -469,6 +914,23 @@ def resolve_term_to_codes(term: str):
         }
     return {}
 
+# Kept byte-identical across calls (no scenario interpolation) so providers can
+# serve it as a cached prompt prefix; the scenario data goes in the user message
+# NARRATIVE_SYSTEM_PROMPT = """As a senior financial analyst, provide a comprehensive analysis of the scenario described in the user's JSON message.
+#
+# The message contains the scenario name and its structured data: direct_causal_chains (the traced supply chain paths), exposed_companies and portfolio_exposure.
+#
+# Based on that structured data, please generate a professional, data-driven narrative report. The report should:
+#
+# 1.  **Executive Summary:** Start with a brief overview of the key findings and the overall impact of the scenario.
+# 2.  **Direct Impact Analysis:** Analyze the direct impact on the traced commodities and their immediate downstream supply chains.
+# 3.  **Broader Business Implications:** For the exposed companies, infer the broader strategic and financial implications. Consider their overall business models, other product lines, and potential vulnerabilities beyond the directly traced supply chains.
+# 4.  **Financial Impact Assessment:** Assess the potential financial impact on the companies and industries involved. Discuss potential revenue loss, cost increases, and margin compression.
+# 5.  **Portfolio Impact Analysis:** Analyze the impact on the investment portfolio. Identify the most exposed positions and quantify the potential risks.
+# 6.  **Forward-Looking Perspective:** Provide a forward-looking perspective on the long-term implications of the scenario. Discuss potential mitigating actions that companies and investors could take.
+#
+# Please structure your response as a professional report, using clear headings and a data-driven approach."""
+
 # def generate_holistic_narrative(scenario, results, client, affected_companies=None):
 #     """Generates a holistic narrative summary using an LLM."""
     
@@ -494,34 +956,13 @@ def resolve_term_to_codes(term: str):
 #     cleaned_affected_companies = clean_nan_from_json(affected_companies)
 #     cleaned_portfolio_exposures = clean_nan_from_json(all_portfolio_exposures)
 
-#     # Create a detailed prompt for the LLM
-#     prompt = f"""
-#     As a senior financial analyst, provide a comprehensive analysis of the following scenario: **{scenario}**
-
-#     **Structured Data Analysis:**
-
-#     **Direct Causal Chains:**
-#     {json.dumps(cleaned_causal_chains, indent=2)}
-
-#     **Exposed Companies:**
-#     {json.dumps(cleaned_affected_companies, indent=2)}
-
-#     **Portfolio Exposure:**
-#     {json.dumps(cleaned_portfolio_exposures, indent=2)}
-
-#     **Analysis Request:**
-
-#     Based on the structured data above, please generate a professional, data-driven narrative report. The report should:
-
-#     1.  **Executive Summary:** Start with a brief overview of the key findings and the overall impact of the scenario.
-#     2.  **Direct Impact Analysis:** Analyze the direct impact on the traced commodities and their immediate downstream supply chains.
-#     3.  **Broader Business Implications:** For the exposed companies, infer the broader strategic and financial implications. Consider their overall business models, other product lines, and potential vulnerabilities beyond the directly traced supply chains.
-#     4.  **Financial Impact Assessment:** Assess the potential financial impact on the companies and industries involved. Discuss potential revenue loss, cost increases, and margin compression.
-#     5.  **Portfolio Impact Analysis:** Analyze the impact on the investment portfolio. Identify the most exposed positions and quantify the potential risks.
-#     6.  **Forward-Looking Perspective:** Provide a forward-looking perspective on the long-term implications of the scenario. Discuss potential mitigating actions that companies and investors could take.
-
-#     Please structure your response as a professional report, using clear headings and a data-driven approach.
-#     """
+#     # Static instructions go in NARRATIVE_SYSTEM_PROMPT; only the scenario data varies
+#     scenario_data = {
+#         "scenario": scenario,
+#         "direct_causal_chains": cleaned_causal_chains,
+#         "exposed_companies": cleaned_affected_companies,
+#         "portfolio_exposure": cleaned_portfolio_exposures,
+#     }
 
 #     # ---------------------------------------------------------------------------------------------------------------------------------------------------
 #     # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
@@ -529,7 +970,10 @@ def resolve_term_to_codes(term: str):
 #     try:
 #         response = client.chat.completions.create(
 #             model="gpt-4.1-2025-04-14",
-#             messages=[{"role": "system", "content": prompt}],
+#             messages=[
+#                 {"role": "system", "content": NARRATIVE_SYSTEM_PROMPT},
+#                 {"role": "user", "content": json.dumps(scenario_data)},
+#             ],
 #             max_tokens=1500,
 #             temperature=0.7,
 #         )
@@ -538,10 +982,27 @@ def resolve_term_to_codes(term: str):
 #         return f"Error generating narrative: {e}"
 #     # ---------------------------------------------------------------------------------------------------------------------------------------------------
 
-def scenario_trace(query: str, depth: int = 2, portfolio_path: str = None):
+def _affected_companies(results):
+    """Distinct company names appearing on any causal chain of the successful traces."""
+    affected = set()
+    for result in results:
+        if result.get('error'):
+            continue
+        for chain in result.get('causal_chains', []):
+            for step in chain:
+                companies = step.get('companies', [])
+                if isinstance(companies, list):
+                    affected.update(c for c in companies if c and c != 'N/A')
+    return list(affected)
+
+def scenario_trace(query: str, depth: int = 2, portfolio_path: str = None, portfolio: dict = None):
     """Traces the supply chain impact from a given shock event, commodity, or location using the SQLite DB."""
     query = query.strip().lower()
 
+    # Read the portfolio once up front instead of once per traced product
+    if portfolio is None and portfolio_path:
+        portfolio = load_portfolio(portfolio_path)
+
     # ---------------------------------------------------------------------------------------------------------------------------------------------------
     # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
     # ---------------------------------------------------------------------------------------------------------------------------------------------------
@@ -554,112 +1015,30 @@ def scenario_trace(query: str, depth: int = 2, portfolio_path: str = None):
     # Default to commodity if no specific type is identified
     shock_type = codes.get("type", "commodity")
 
-    # Route to appropriate logic
+    # Each shock type resolves to the list of products to trace; the rest is shared
     if shock_type == 'event':
         # ---------------------------------------------------------------------------------------------------------------------------------------------------
         # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
         # ---------------------------------------------------------------------------------------------------------------------------------------------------
-        event_df = fetch_df('SELECT * FROM event_to_commodity')
-        company_main_products_df = fetch_df('SELECT * FROM company_main_products')
+        targets = get_lookup('event_to_commodity', 'Event', 'Commodity').get(query, [])
         # ---------------------------------------------------------------------------------------------------------------------------------------------------
-        if 'share_pct' in company_main_products_df.columns:
-            # strip %, commas, and coerce to float
-            company_main_products_df['share_pct'] = (
-                company_main_products_df['share_pct']
-                .astype(str).str.replace('%', '', regex=False).str.replace(',', '', regex=False).str.strip()
-            )
-            company_main_products_df['share_pct'] = pd.to_numeric(company_main_products_df['share_pct'], errors='coerce')
-
-        
-        commodities = event_df[event_df['Event'].str.lower() == query]['Commodity'].tolist()
-        
-        all_results = []
-        affected_companies = set()
-        for commodity in commodities:
-            result = trace_supply_chain(commodity, depth, portfolio_path)
-            all_results.append(result)
-            if not result.get('error'):
-                for chain in result.get('causal_chains', []):
-                    for step in chain:
-                        # Access companies from the new node structure
-                        companies = step.get('companies', [])
-                        if isinstance(companies, list):
-                            for company in companies:
-                                if company and company != 'N/A':
-                                    affected_companies.add(company)
-
-        # Generate a holistic narrative summary
-        narrative_summary = None
-        try:
-            narrative_summary = generate_holistic_narrative(query, all_results, client, list(affected_companies))
-        except:
-            pass
-
-        return {"scenario": query, "results": all_results, "narrative_summary": narrative_summary}
-    
     elif shock_type == 'location':
         # ---------------------------------------------------------------------------------------------------------------------------------------------------
         # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
         # ---------------------------------------------------------------------------------------------------------------------------------------------------
-        tier_1_locations_df = fetch_df('SELECT * FROM tier_1_locations')
+        targets = get_lookup('tier_1_locations', 'Location', 'Product Name').get(query, [])
         # ---------------------------------------------------------------------------------------------------------------------------------------------------
-        
-        products = tier_1_locations_df[tier_1_locations_df['Location'].str.lower() == query]['Product Name'].tolist()
-        results = [trace_supply_chain(p, depth, portfolio_path) for p in products]
-        
-        affected_companies = set()
-        for result in results:
-            if not result.get('error'):
-                for chain in result.get('causal_chains', []):
-                    for step in chain:
-                        # Access companies from the new node structure
-                        companies = step.get('companies', [])
-                        if isinstance(companies, list):
-                            for company in companies:
-                                if company and company != 'N/A':
-                                    affected_companies.add(company)
-
-        narrative_summary = None
-        try:
-            narrative_summary = generate_holistic_narrative(query, results, client, list(affected_companies))
-        except:
-            pass
+    else: # Commodity or other terms
+        targets = codes.get('product_codes', []) or [query]
 
-        return {"scenario": query, "results": results, "narrative_summary": narrative_summary}
+    results = [trace_supply_chain(t, depth, portfolio=portfolio) for t in targets]
+    affected_companies = _affected_companies(results)
 
-    else: # Commodity or other terms
-        product_codes = codes.get('product_codes', [])
-        results = []
-        affected_companies = set()
-        if product_codes:
-            for p in product_codes:
-                result = trace_supply_chain(p, depth, portfolio_path)
-                results.append(result)
-                if not result.get('error'):
-                    for chain in result.get('causal_chains', []):
-                        for step in chain:
-                            # Access companies from the new node structure
-                            companies = step.get('companies', [])
-                            if isinstance(companies, list):
-                                for company in companies:
-                                    if company and company != 'N/A':
-                                        affected_companies.add(company)
-        else:
-            result = trace_supply_chain(query, depth, portfolio_path)
-            results.append(result)
-            if not result.get('error'):
-                for chain in result.get('causal_chains', []):
-                    for step in chain:
-                        # Access companies from the new node structure
-                        companies = step.get('companies', [])
-                        if isinstance(companies, list):
-                            for company in companies:
-                                if company and company != 'N/A':
-                                    affected_companies.add(company)
-
-        narrative_summary = None
-        try:
-            narrative_summary = generate_holistic_narrative(query, results, client, list(affected_companies))
-        except:
-            pass
-        return {"scenario": query, "results": results, "narrative_summary": narrative_summary}
\ No newline at end of file
+    # Generate a holistic narrative summary
+    narrative_summary = None
+    try:
+        narrative_summary = generate_holistic_narrative(query, results, client, affected_companies)
+    except:
+        pass
+
+    return {"scenario": query, "results": results, "narrative_summary": narrative_summary}
\ No newline at end of file
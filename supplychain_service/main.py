@@ -1,5 +1,6 @@
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from router import router
 
-app = FastAPI(title="Supply Chain Service", version="1.0.0")
+app = FastAPI(title="Supply Chain Service", version="1.0.0", default_response_class=ORJSONResponse)
 app.include_router(router)
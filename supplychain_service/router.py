@@ -1,13 +1,13 @@
 from fastapi import APIRouter, HTTPException, Query, Request, UploadFile, File, Form, Depends
-from fastapi.responses import JSONResponse
-import tempfile
-import os
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 import json
 from typing import List
 
 from helpers import (
     get_stock_history,
     get_products_by_company,
+    df_records,
     trace_supply_chain,
     scenario_trace,
     FUNCTION_DEFINITIONS,
@@ -15,7 +15,6 @@ from helpers import (
 from schema import (
     StockHistoryResponse,
     ProductsResponse,
-    TraceResponse,
 )
 
 router = APIRouter(prefix="/supply-chain", tags=["SupplyChain"])
@@ -32,7 +31,11 @@ def functions() -> List[dict]:
     return FUNCTION_DEFINITIONS
 
 
-@router.get("/stock-history", response_model=StockHistoryResponse)
+@router.get(
+    "/stock-history",
+    response_model=None,
+    responses={200: {"model": StockHistoryResponse}},
+)
 def stock_history(
     ticker: str = Query(..., description="Stock ticker symbol"),
     period: str = Query("1y", description="Data period"),
@@ -44,19 +47,24 @@ def stock_history(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/products", response_model=ProductsResponse)
+@router.get(
+    "/products",
+    response_model=None,
+    responses={200: {"model": ProductsResponse}},
+)
 def products(ticker: str = Query(..., description="Company ticker")):
     try:
         df = get_products_by_company(ticker.upper())
-        return {"products": df.to_dict(orient="records")}
+        return {"products": df_records(df)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/trace", response_model=TraceResponse)
+# trace_supply_chain returns causal chains/exposure/narrative, not the TraceResponse shape
+@router.get("/trace", response_model=None)
 def trace(
     product: str = Query(..., description="Input product name"),
-    depth: str = Query("2", description="Trace depth"),
+    depth: int = Query(2, ge=1, description="Trace depth"),
 ):
     try:
         result = trace_supply_chain(product, depth)
@@ -92,30 +100,27 @@ async def scenario_trace_endpoint(
             query = data.get("query")
             depth = int(data.get("depth", 2))
             portfolio_path = data.get("portfolio_path", None)
+            portfolio_data = None
         except Exception as e:
             raise HTTPException(status_code=400, detail="Invalid JSON payload")
     else:
         portfolio_path = None
+        portfolio_data = None
         if portfolio:
+            # Reject non-JSON uploads before touching the body
+            if portfolio.filename and not portfolio.filename.lower().endswith(".json"):
+                raise HTTPException(status_code=400, detail="Portfolio upload must be a .json file")
+            # Parse straight from the spooled upload file instead of copying it into a bytes buffer
             try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.json') as tmp:
-                    tmp.write(await portfolio.read())
-                    portfolio_path = tmp.name
-            except Exception as e:
-                raise HTTPException(status_code=500, detail="Error saving uploaded file")
+                portfolio_data = await run_in_threadpool(json.load, portfolio.file)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Uploaded portfolio is not valid JSON")
 
     if not query:
         raise HTTPException(status_code=400, detail="Query is required")
 
-    try:
-        result = scenario_trace(query, depth, portfolio_path)
-    finally:
-        # Clean up the temp portfoli file
-        if portfolio_path and os.path.exists(portfolio_path):
-            try:
-                os.remove(portfolio_path)
-            except Exception:
-                pass
+    # scenario_trace does graph work and an LLM round-trip; keep it off the event loop
+    result = await run_in_threadpool(scenario_trace, query, depth, portfolio_path, portfolio_data)
 
-    return JSONResponse(content=result)
+    return ORJSONResponse(content=result)
 # --------------------------- TO BE CHANGED: remove this import and add actual authorisation/ db calls to fetch portfolio ---------------------------
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""
+Shared pytest fixtures for the supply-chain service tests
+"""
+
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Provided by the host application rather than this service's requirements;
+# without them the service modules cannot be imported, so those tests skip
+HOST_MODULES = ("flask_login", "openai")
+
+
+def _import_service_module(name, *extra_modules):
+    for module in HOST_MODULES + extra_modules:
+        pytest.importorskip(module)
+    return importlib.import_module(name)
+
+
+@pytest.fixture(scope="session")
+def helpers():
+    """The helpers module, skipping when the host-provided imports are missing"""
+    return _import_service_module("helpers")
+
+
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient (and one app startup) for the whole test session"""
+    app = _import_service_module("main", "auth").app
+    with TestClient(app) as c:
+        yield c
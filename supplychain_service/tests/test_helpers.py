@@ -0,0 +1,339 @@
+"""
+Tests for the caching helpers behind the supply-chain service
+"""
+
+import os
+import sqlite3
+import sys
+import types
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def _unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+class TestSemanticCache:
+    @pytest.fixture
+    def make_cache(self, helpers, tmp_path):
+        path = str(tmp_path / "llm_cache.db")
+
+        def make(**kwargs):
+            kwargs.setdefault("threshold", 0.95)
+            kwargs.setdefault("max_entries", 10)
+            kwargs.setdefault("ttl", 3600)
+            return helpers.SemanticCache(path, **kwargs)
+
+        make.path = path
+        return make
+
+    def test_hit_on_near_duplicate_prompt(self, make_cache):
+        cache = make_cache()
+        cache.add("alice", _unit(1, 0, 0), ("answer", None, None))
+        assert cache.lookup("alice", _unit(1, 0.01, 0)) == ("answer", None, None)
+        assert cache.lookup("alice", _unit(0, 1, 0)) is None
+
+    def test_entries_are_isolated_per_owner(self, make_cache):
+        cache = make_cache()
+        cache.add("alice", _unit(1, 0, 0), ("alice's answer", None, None))
+        assert cache.lookup("bob", _unit(1, 0, 0)) is None
+        cache.add("bob", _unit(1, 0, 0), ("bob's answer", None, None))
+        assert cache.lookup("alice", _unit(1, 0, 0)) == ("alice's answer", None, None)
+        assert cache.lookup("bob", _unit(1, 0, 0)) == ("bob's answer", None, None)
+
+    def test_owner_ids_compare_as_strings(self, make_cache):
+        cache = make_cache()
+        cache.add(7, _unit(1, 0, 0), ("answer", None, None))
+        assert cache.lookup("7", _unit(1, 0, 0)) == ("answer", None, None)
+
+    def test_expired_entry_is_skipped_for_next_best_live_match(self, helpers, make_cache, monkeypatch):
+        cache = make_cache(threshold=0.9, ttl=60)
+        now = 1_000_000.0
+        monkeypatch.setattr(helpers.time, "time", lambda: now)
+        cache.add("alice", _unit(1, 0, 0), ("stale", None, None))
+        now += 30
+        cache.add("alice", _unit(1, 0.2, 0), ("fresh", None, None))
+        assert cache.lookup("alice", _unit(1, 0, 0)) == ("stale", None, None)
+        now += 40
+        assert cache.lookup("alice", _unit(1, 0, 0)) == ("fresh", None, None)
+        now += 60
+        assert cache.lookup("alice", _unit(1, 0, 0)) is None
+
+    def test_least_recently_used_entry_is_evicted(self, make_cache):
+        cache = make_cache(max_entries=2)
+        cache.add("alice", _unit(1, 0, 0), ("x", None, None))
+        cache.add("alice", _unit(0, 1, 0), ("y", None, None))
+        assert cache.lookup("alice", _unit(1, 0, 0)) == ("x", None, None)
+        cache.add("alice", _unit(0, 0, 1), ("z", None, None))
+        assert cache.lookup("alice", _unit(0, 1, 0)) is None
+        assert cache.lookup("alice", _unit(1, 0, 0)) == ("x", None, None)
+        assert cache.lookup("alice", _unit(0, 0, 1)) == ("z", None, None)
+        with sqlite3.connect(make_cache.path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 2
+
+    def test_reload_from_disk_drops_expired_rows(self, helpers, make_cache, monkeypatch):
+        now = 1_000_000.0
+        monkeypatch.setattr(helpers.time, "time", lambda: now)
+        cache = make_cache(ttl=60)
+        cache.add("alice", _unit(1, 0, 0), ("old", None, None))
+        now += 50
+        cache.add("alice", _unit(0, 1, 0), ("new", None, None))
+        now += 20
+
+        reloaded = make_cache(ttl=60)
+        assert reloaded.lookup("alice", _unit(0, 1, 0)) == ("new", None, None)
+        assert reloaded.lookup("alice", _unit(1, 0, 0)) is None
+        with sqlite3.connect(make_cache.path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 1
+
+    def test_reload_drops_table_without_owner_column(self, make_cache):
+        with sqlite3.connect(make_cache.path) as conn:
+            conn.execute("CREATE TABLE llm_cache (id INTEGER PRIMARY KEY, embedding BLOB, response TEXT, created_at REAL)")
+            conn.execute("INSERT INTO llm_cache (embedding, response, created_at) VALUES (?, '[\"x\", null, null]', 0)",
+                         (_unit(1, 0, 0).tobytes(),))
+        cache = make_cache(ttl=float("inf"))
+        assert cache.lookup("alice", _unit(1, 0, 0)) is None
+
+    def test_zero_max_entries_disables_the_cache(self, make_cache):
+        cache = make_cache(max_entries=0)
+        cache.add("alice", _unit(1, 0, 0), ("answer", None, None))
+        assert cache.lookup("alice", _unit(1, 0, 0)) is None
+
+    def test_reply_round_trips_through_json(self, make_cache):
+        # Cached replies come back as they would from JSON: NaN -> None, numpy -> Python types
+        cache = make_cache()
+        artifact = {"share_pct": np.float64("nan"), "count": np.int64(3), "values": np.array([1.5, 2.5])}
+        cache.add("alice", _unit(1, 0, 0), ("answer", artifact, "products"))
+        content, cached, artifact_type = cache.lookup("alice", _unit(1, 0, 0))
+        assert (content, artifact_type) == ("answer", "products")
+        assert cached == {"share_pct": None, "count": 3, "values": [1.5, 2.5]}
+        assert type(cached["count"]) is int
+
+    def test_unserializable_reply_is_not_cached(self, make_cache):
+        cache = make_cache()
+        cache.add("alice", _unit(1, 0, 0), ("answer", object(), "custom"))
+        assert cache.lookup("alice", _unit(1, 0, 0)) is None
+
+
+class TestCachedReply:
+    @pytest.fixture
+    def cache_env(self, helpers, tmp_path, monkeypatch):
+        class Encoder:
+            calls = 0
+
+            def encode(self, text, normalize_embeddings=True):
+                Encoder.calls += 1
+                return _unit(1, 0, 0)
+
+        cache = helpers.SemanticCache(str(tmp_path / "llm_cache.db"), threshold=0.95, max_entries=10, ttl=3600)
+        cache.add("alice", _unit(1, 0, 0), ("cached", None, None))
+        monkeypatch.setattr(helpers, "_cache_owner", lambda: "alice")
+        monkeypatch.setattr(helpers, "_get_model", Encoder)
+        monkeypatch.setattr(helpers, "get_semantic_cache", lambda: cache)
+        return Encoder
+
+    def test_enabled_cache_serves_stand_alone_prompt(self, helpers, cache_env, monkeypatch):
+        monkeypatch.setattr(helpers, "SEMANTIC_CACHE_ENABLED", True)
+        embedding, cached = helpers._cached_reply("what is cobalt used for?", [], None)
+        assert cached == ("cached", None, None)
+        assert embedding is not None
+
+    def test_disabled_cache_is_bypassed(self, helpers, cache_env, monkeypatch):
+        monkeypatch.setattr(helpers, "SEMANTIC_CACHE_ENABLED", False)
+        assert helpers._cached_reply("what is cobalt used for?", [], None) == (None, None)
+        assert cache_env.calls == 0
+
+    def test_conversations_and_anonymous_users_are_bypassed(self, helpers, cache_env, monkeypatch):
+        monkeypatch.setattr(helpers, "SEMANTIC_CACHE_ENABLED", True)
+        history = [{"role": "user", "content": "hi"}]
+        assert helpers._cached_reply("what is cobalt used for?", history, None) == (None, None)
+        monkeypatch.setattr(helpers, "_cache_owner", lambda: None)
+        assert helpers._cached_reply("what is cobalt used for?", [], None) == (None, None)
+        assert cache_env.calls == 0
+
+
+class TestSinkPaths:
+    @pytest.fixture
+    def graph(self):
+        # Diamond with a cycle and a shortcut: a -> b -> c -> d, a -> c, b -> e, c -> b
+        G = nx.DiGraph()
+        G.add_edges_from([("a", "b"), ("a", "c"), ("b", "c"), ("b", "e"), ("c", "d"), ("c", "b")])
+        return G
+
+    @staticmethod
+    def _reference(G, source, depth):
+        leaves = [n for n, out_degree in G.out_degree() if out_degree == 0]
+        return [path for leaf in leaves for path in nx.all_simple_paths(G, source, leaf, cutoff=depth)]
+
+    @pytest.mark.parametrize("depth", [1, 2, 3, 4])
+    def test_matches_all_simple_paths(self, helpers, graph, depth):
+        paths = helpers._sink_paths(graph, "a", depth)
+        expected = self._reference(graph, "a", depth)
+        assert sorted(paths) == sorted(expected)
+        for leaf in ("d", "e"):
+            assert [p for p in paths if p[-1] == leaf] == [p for p in expected if p[-1] == leaf]
+
+    def test_depth_bounds_path_length(self, helpers, graph):
+        assert helpers._sink_paths(graph, "a", 1) == []
+        assert helpers._sink_paths(graph, "a", 2) == [["a", "b", "e"], ["a", "c", "d"]]
+        assert helpers._sink_paths(graph, "a", 0) == []
+
+    def test_leaf_source_yields_itself(self, helpers, graph):
+        assert helpers._sink_paths(graph, "d", 2) == [["d"]]
+        assert helpers._sink_paths(graph, "d", 0) == [["d"]]
+
+
+@pytest.fixture
+def reference_db(helpers, tmp_path, monkeypatch):
+    """A small SQLite reference DB swapped in for helpers.DB_PATH, with a clean table cache"""
+    path = tmp_path / "supply_chain.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE products (code TEXT, name TEXT, unit TEXT)")
+        conn.executemany("INSERT INTO products VALUES (?, ?, ?)", [
+            ("2822", "Cobalt oxides", "kg"),
+            ("8507", "Batteries", None),
+            ("2822", "cobalt OXIDES", "t"),
+            (None, "Unnamed", "kg"),
+        ])
+    monkeypatch.setattr(helpers, "DB_PATH", str(path))
+    monkeypatch.setattr(helpers, "_DB_MTIME", None)
+    helpers._reset_shared_connection()
+    helpers._TABLE_CACHE.clear()
+    yield path
+    helpers._reset_shared_connection()
+    helpers._TABLE_CACHE.clear()
+
+
+def _touch_later(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+class TestGetTable:
+    def test_returns_full_table_with_blanks_filled(self, helpers, reference_db):
+        df = helpers.get_table("products")
+        assert df.columns.tolist() == ["code", "name", "unit"]
+        assert df["unit"].tolist() == ["kg", "", "t", "kg"]
+        assert df["code"].tolist()[-1] == ""
+
+    def test_fill_blanks_false_keeps_nulls(self, helpers, reference_db):
+        df = helpers.get_table("products", fill_blanks=False)
+        assert df["unit"].isna().tolist() == [False, True, False, False]
+
+    def test_columns_projects_the_query(self, helpers, reference_db):
+        df = helpers.get_table("products", columns=("name", "code"))
+        assert df.columns.tolist() == ["name", "code"]
+        assert df.equals(helpers.get_table("products")[["name", "code"]])
+
+    def test_repeated_calls_share_one_frame(self, helpers, reference_db):
+        assert helpers.get_table("products") is helpers.get_table("products")
+        assert helpers.get_table("products") is not helpers.get_table("products", fill_blanks=False)
+
+    def test_cache_is_dropped_when_the_db_file_changes(self, helpers, reference_db):
+        before = helpers.get_table("products")
+        with sqlite3.connect(reference_db) as conn:
+            conn.execute("INSERT INTO products VALUES ('7403', 'Copper', 'kg')")
+        _touch_later(reference_db)
+        after = helpers.get_table("products")
+        assert after is not before
+        assert len(after) == len(before) + 1
+
+
+class TestGetLookup:
+    def test_matches_a_case_insensitive_scan(self, helpers, reference_db):
+        lookup = helpers.get_lookup("products", "name", "unit")
+        df = helpers.get_table("products", fill_blanks=False)
+        for key in ("cobalt oxides", "batteries", "unnamed"):
+            scan = df.loc[df["name"].str.lower() == key, "unit"].tolist()
+            assert lookup[key] == scan
+        assert lookup["cobalt oxides"] == ["kg", "t"]
+        assert len(lookup["batteries"]) == 1 and pd.isna(lookup["batteries"][0])
+
+    def test_null_keys_are_skipped(self, helpers, reference_db):
+        assert set(helpers.get_lookup("products", "code", "name")) == {"2822", "8507"}
+
+    def test_index_is_built_once_per_db_version(self, helpers, reference_db):
+        lookup = helpers.get_lookup("products", "name", "unit")
+        assert helpers.get_lookup("products", "name", "unit") is lookup
+        with sqlite3.connect(reference_db) as conn:
+            conn.execute("INSERT INTO products VALUES ('2822', 'COBALT OXIDES', 'g')")
+        _touch_later(reference_db)
+        assert helpers.get_lookup("products", "name", "unit")["cobalt oxides"] == ["kg", "t", "g"]
+
+
+class TestStockCache:
+    @pytest.fixture
+    def cache_dir(self, helpers, tmp_path, monkeypatch):
+        monkeypatch.setattr(helpers, "STOCK_CACHE_DIR", tmp_path)
+        monkeypatch.setattr(helpers, "STOCK_CACHE_TTL", None)
+        return tmp_path
+
+    @pytest.fixture
+    def yfinance(self, monkeypatch):
+        """Stand-in yfinance module returning a fixed tz-aware history and counting downloads"""
+        module = types.SimpleNamespace(downloads=0, history=None)
+        index = pd.DatetimeIndex(["2025-01-02 09:30", "2025-01-03 09:30"], tz="America/New_York", name="Date")
+        module.history = pd.DataFrame({"Open": [1.0, 2.0], "Close": [10.5, 11.0]}, index=index)
+
+        class Ticker:
+            def __init__(self, ticker):
+                pass
+
+            def history(self, period, interval):
+                module.downloads += 1
+                return module.history
+
+        module.Ticker = Ticker
+        monkeypatch.setitem(sys.modules, "yfinance", module)
+        return module
+
+    @staticmethod
+    def _write_cache(path, closes, age=0):
+        pd.DataFrame({"Date": ["2025-01-02"] * len(closes), "Close": closes}).to_parquet(path, index=False)
+        stamp = os.path.getmtime(path) - age
+        os.utime(path, (stamp, stamp))
+
+    def test_ttl_depends_on_interval(self, helpers, cache_dir, monkeypatch):
+        assert helpers._stock_cache_ttl("1d") == 24 * 3600
+        assert helpers._stock_cache_ttl("1h") == 15 * 60
+        monkeypatch.setattr(helpers, "STOCK_CACHE_TTL", "60")
+        assert helpers._stock_cache_ttl("1d") == 60.0
+
+    def test_fresh_cache_is_served_without_download(self, helpers, cache_dir, monkeypatch):
+        monkeypatch.setitem(sys.modules, "yfinance", None)  # any download attempt raises ImportError
+        self._write_cache(cache_dir / "AAPL_1y_1d.parquet", [99.0])
+        result = helpers.get_stock_history("aapl")
+        assert result["prices"] == [{"Date": "2025-01-02", "Close": 99.0}]
+        assert result["ticker"] == "AAPL"
+
+    def test_miss_downloads_and_writes_cache(self, helpers, cache_dir, yfinance):
+        hist = helpers._fetch_close_history("AAPL", "1y", "1d")
+        assert hist["Date"].tolist() == ["2025-01-02", "2025-01-03"]
+        assert hist["Close"].tolist() == [10.5, 11.0]
+        cached = pd.read_parquet(cache_dir / "AAPL_1y_1d.parquet")
+        assert cached.equals(hist.reset_index(drop=True))
+        helpers._fetch_close_history("AAPL", "1y", "1d")
+        assert yfinance.downloads == 1
+
+    def test_stale_cache_is_refreshed(self, helpers, cache_dir, yfinance):
+        path = cache_dir / "AAPL_5d_1h.parquet"
+        self._write_cache(path, [99.0], age=16 * 60)
+        hist = helpers._fetch_close_history("AAPL", "5d", "1h")
+        assert yfinance.downloads == 1
+        assert hist["Close"].tolist() == [10.5, 11.0]
+        assert pd.read_parquet(path)["Close"].tolist() == [10.5, 11.0]
+
+    def test_unreadable_cache_falls_back_to_download(self, helpers, cache_dir, yfinance):
+        (cache_dir / "AAPL_1y_1d.parquet").write_bytes(b"not parquet")
+        assert helpers._fetch_close_history("AAPL", "1y", "1d")["Close"].tolist() == [10.5, 11.0]
+        assert yfinance.downloads == 1
+
+    def test_empty_history_is_not_cached(self, helpers, cache_dir, yfinance):
+        yfinance.history = yfinance.history.iloc[:0]
+        assert helpers._fetch_close_history("NONE", "1y", "1d").empty
+        assert not (cache_dir / "NONE_1y_1d.parquet").exists()
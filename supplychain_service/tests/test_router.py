@@ -0,0 +1,30 @@
+"""
+Tests for the supply-chain HTTP endpoints
+"""
+
+
+class TestTraceEndpoint:
+    def test_trace_non_leaf_product(self, client):
+        # Cobalt oxides feed into downstream products, so the trace has to walk the graph
+        resp = client.get("/supply-chain/trace", params={"product": "Cobalt oxides and hydroxides", "depth": 2})
+        assert resp.status_code == 200
+        data = resp.json()
+        assert data["product"] == "cobalt oxides and hydroxides"
+        assert data["trace_depth"] == 2
+        assert data["causal_chains"]
+        assert all(1 < len(chain) <= 3 for chain in data["causal_chains"])
+        assert data["causal_chains"][0][0]["label"] == "cobalt oxides and hydroxides"
+
+    def test_trace_default_depth(self, client):
+        resp = client.get("/supply-chain/trace", params={"product": "cobalt oxides and hydroxides"})
+        assert resp.status_code == 200
+        assert resp.json()["trace_depth"] == 2
+
+    def test_trace_invalid_depth(self, client):
+        for depth in ("0", "two"):
+            resp = client.get("/supply-chain/trace", params={"product": "cobalt oxides and hydroxides", "depth": depth})
+            assert resp.status_code == 422
+
+    def test_trace_unknown_product(self, client):
+        resp = client.get("/supply-chain/trace", params={"product": "no such product"})
+        assert resp.status_code == 404